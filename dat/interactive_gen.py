@@ -7,6 +7,7 @@ import argparse
 from os.path import join as pjoin
 from itertools import izip
 from preprocessing.cfg import EN_DISCOURSE_MARKERS
+from preprocessing.util import hash_split_indices
 from data import get_dis
 import itertools
 import random
@@ -22,6 +23,8 @@ parser.add_argument("--senteval", type=str, default='~/SentEval/data/senteval_da
                     help="point to senteval data directory")
 parser.add_argument("--seed", type=int, default=1234, help="seed")
 parser.add_argument("--train_size", default=0.9, type=float)
+parser.add_argument("--split_mode", type=str, default="shuffle",
+                    help="shuffle|hash, hash puts each example in a split by a hash of (s1, s2), stable as the corpus grows")
 parser.add_argument("--gen_senteval", action='store_true', help="generate a dataset to senteval")
 parser.add_argument("--gen_dis", action='store_true', help="generate a dataset to DIS training format")
 
@@ -109,6 +112,26 @@ Generate SentEval dataset
 """
 
 
+def split_dataset(dataset):
+    """
+    :param dataset: list of [s1, s2, label]
+    :return: train, valid and test lists of indices into dataset
+    """
+    num_examples = len(dataset)
+    assignments = range(num_examples)
+    np.random.shuffle(assignments)
+
+    if params.split_mode == "hash":
+        splits = hash_split_indices(((dataset[a][0], dataset[a][1]) for a in assignments), split_proportions)
+        return [[assignments[i] for i in splits[split]] for split in ["train", "valid", "test"]]
+
+    train_numbers = assignments[:int(np.rint(num_examples * split_proportions['train']))]
+    valid_numbers = assignments[int(np.rint(num_examples * split_proportions['train'])): int(
+        np.rint(num_examples * (split_proportions['train'] + split_proportions['valid'])))]
+    test_numbers = assignments[int(np.rint(num_examples * (split_proportions['train'] + split_proportions['valid']))):]
+    return train_numbers, valid_numbers, test_numbers
+
+
 def write_to_file(file_name, data, assignments, split_num):
     # split_num=0: s1, split_num=1: s2, split_num=2: label
     with open(pjoin(DAT_dir, file_name), 'w') as f:
@@ -219,14 +242,7 @@ def generate_senteval():
     random.shuffle(dataset)
     random.shuffle(dataset)
 
-    num_examples = len(dataset)
-    assignments = range(num_examples)
-    np.random.shuffle(assignments)
-
-    train_numbers = assignments[:int(np.rint(num_examples * split_proportions['train']))]
-    valid_numbers = assignments[int(np.rint(num_examples * split_proportions['train'])): int(
-        np.rint(num_examples * (split_proportions['train'] + split_proportions['valid'])))]
-    test_numbers = assignments[int(np.rint(num_examples * (split_proportions['train'] + split_proportions['valid']))):]
+    train_numbers, valid_numbers, test_numbers = split_dataset(dataset)
 
     print "train {}, dev {}, test {}".format(len(train_numbers), len(valid_numbers), len(test_numbers))
 
@@ -294,14 +310,7 @@ def generate_dis():
     random.shuffle(dataset)
     random.shuffle(dataset)
 
-    num_examples = len(dataset)
-    assignments = range(num_examples)
-    np.random.shuffle(assignments)
-
-    train_numbers = assignments[:int(np.rint(num_examples * split_proportions['train']))]
-    valid_numbers = assignments[int(np.rint(num_examples * split_proportions['train'])): int(
-        np.rint(num_examples * (split_proportions['train'] + split_proportions['valid'])))]
-    test_numbers = assignments[int(np.rint(num_examples * (split_proportions['train'] + split_proportions['valid']))):]
+    train_numbers, valid_numbers, test_numbers = split_dataset(dataset)
 
     print "train {}, dev {}, test {}".format(len(train_numbers), len(valid_numbers), len(test_numbers))
 
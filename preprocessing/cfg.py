@@ -60,6 +60,32 @@ EN_PORT = 12345
 CH_PORT = 12346
 SP_PORT = 12347
 
+# every corenlp server the parse stage may use, by language.
+# list more than one to spread requests over several parser processes
+CORENLP_ENDPOINTS = {
+    "en": ["http://localhost:{}".format(EN_PORT)],
+    "ch": ["http://localhost:{}".format(CH_PORT)],
+    "sp": ["http://localhost:{}".format(SP_PORT)]
+}
+CORENLP_BALANCE = "round_robin"  # round_robin|least_outstanding
+# a server is taken out of rotation after this many consecutive failures,
+# and tried again after CORENLP_RETRY_AFTER seconds
+CORENLP_MAX_FAILURES = 3
+CORENLP_RETRY_AFTER = 30
+# when no server answers a request, wait CORENLP_RETRY_AFTER seconds and try them all
+# again, this many times, before giving up (a server restarting, a network blip...)
+CORENLP_RETRIES = 1
+CORENLP_TIMEOUT = 120
+
+# keep-alive connections held open to each corenlp server
+CORENLP_POOL_SIZE = 16
+# sentences sent to the corenlp server in one request
+PARSE_BATCH_SIZE = 32
+# requests kept in flight against the corenlp server
+PARSE_CONCURRENCY = 8
+# the parse stage saves its progress every this many sentences
+PARSE_CHECKPOINT_EVERY = 10000
+
 _PAD = b"<pad>" # no need to pad
 _UNK = b"<unk>"
 _START_VOCAB = [_PAD, _UNK]
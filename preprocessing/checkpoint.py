@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+
+"""
+Progress of a long stage writing one output file, so that a crashed or killed run can be resumed
+
+The manifest sits next to the output file and records how far into the input
+everything has been processed, and how large the output was at that point.
+For the parse stage (parse_driver.py) the input offset is a byte offset in the
+filtered sentences file; for the segmentation of producer.py (segmentation.py)
+it is the number of examples segmented. The output is fsynced before the
+manifest is replaced, so the manifest never claims more than what's on disk;
+anything written after the last checkpoint is cut off when resuming.
+"""
+
+import os
+import json
+
+
+class Checkpoint(object):
+    def __init__(self, output_path):
+        self.output_path = output_path
+        self.path = output_path + ".checkpoint"
+
+    def load(self):
+        """
+        :return: dict with input_offset, output_size and sentences (the count of what was processed),
+                 None if there is nothing to resume
+        """
+        if not os.path.exists(self.path):
+            return None
+        with open(self.path, 'rb') as f:
+            state = json.load(f)
+        if state["done"]:
+            return None
+        return state
+
+    @property
+    def done(self):
+        """
+        True once the stage has written all of its output
+        """
+        if not os.path.exists(self.path):
+            return False
+        with open(self.path, 'rb') as f:
+            return json.load(f)["done"]
+
+    def save(self, output_file, input_offset, sentences, done=False):
+        output_file.flush()
+        os.fsync(output_file.fileno())
+        state = {
+            "input_offset": input_offset,
+            "output_size": os.fstat(output_file.fileno()).st_size,
+            "sentences": sentences,
+            "done": done,
+        }
+
+        # replace the manifest in one step, a crash leaves either the old one or the new one
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, 'wb') as f:
+            json.dump(state, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.rename(tmp_path, self.path)
+
+        directory = os.open(os.path.dirname(os.path.abspath(self.path)), os.O_RDONLY)
+        try:
+            os.fsync(directory)
+        finally:
+            os.close(directory)
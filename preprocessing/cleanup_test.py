@@ -0,0 +1,159 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Checks the precompiled cleanups (gigaword_cn.process_sent, gigaword_es.process_sent,
+parser.cleanup) against the chains of str.replace and re.sub they replaced,
+on random sentences, and times the two with --benchmark.
+"""
+
+import re
+import sys
+import time
+import random
+import argparse
+
+import gigaword_cn
+import gigaword_es
+from parser import cleanup, cleanup_batch, capitalize
+
+reload(sys)
+sys.setdefaultencoding('utf8')
+
+
+def setup_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--random_cases", default=100000, type=int, help="number of random sentences to compare on")
+    parser.add_argument("--benchmark", action='store_true', help="time both cleanups")
+    parser.add_argument("--benchmark_sentences", default=200000, type=int)
+    return parser.parse_args()
+
+
+def reference_process_sent_ch(sent, lang="ch"):
+    sent = re.sub(r"\(.+\)", "", sent)  # get rid of parentheses (many content inside are English/other languages)
+
+    sent = sent.replace("&amp;gt;", "")
+
+    # HTML entities
+    sent = sent.replace("&lt;", '<')
+    sent = sent.replace("&gt;", '>')
+    sent = sent.replace("&amp;", '&')
+    sent = sent.replace("&apos;", '\'')
+    sent = sent.replace("&quot;", '"')
+
+    if lang == "ch":
+        sent = re.sub(r'[A-Z a-z.]+', "", sent)  # get rid of English characters
+        # and all spaces in the sentence. This will only work in Chinese
+        sent = re.sub(r'[0-9]+', "", sent)
+
+    sent = re.sub(r"\(", "", sent)
+    sent = re.sub(r"\)", "", sent)
+
+    # resolve weird 「 symbol
+    sent = sent.replace("「", '"')
+    sent = sent.replace("」", '"')
+
+    return sent
+
+
+def reference_process_sent_sp(sent, lang="sp"):
+    sent = sent.replace("&amp;gt;", "")
+
+    # HTML entities
+    sent = sent.replace("&lt;", '<')
+    sent = sent.replace("&gt;", '>')
+    sent = sent.replace("&amp;", '&')
+    sent = sent.replace("&apos;", '\'')
+    sent = sent.replace("&quot;", '"')
+
+    return sent
+
+
+def reference_cleanup(s, lang="en"):
+    s = s.replace(" @-@ ", "-")
+    if len(s) > 0:
+        s = capitalize(s)
+    if lang == "en":
+      s = s.replace(" i ", " I ")
+      s = s.replace(" im ", " I'm ")
+      if len(s) > 3:
+          if s[0:3] == "im ":
+              s = "I'm " + s[3:]
+      s = re.sub(' " (.*) " ', ' "\\1" ', s)
+    return s
+
+
+# pieces the cleanups look for, mixed with plain text
+PIECES = ["&amp;gt;", "&lt;", "&gt;", "&amp;", "&apos;", "&quot;", "&", "amp;", "quot;", "apos;", "gt;", ";",
+          "(", ")", "「", "」", "\"", " ", ".", "a", "Z", "7", "i", "im", " @-@ ", " \" ", "\n",
+          "中", "文", "el", "ñ"]
+
+
+def random_sentence(rng, length):
+    return "".join(rng.choice(PIECES) for _ in range(length))
+
+
+def test(n_random):
+    cases = [
+        ("process_sent ch", lambda s: gigaword_cn.process_sent(s), reference_process_sent_ch),
+        ("process_sent ch as sp", lambda s: gigaword_cn.process_sent(s, "sp"), lambda s: reference_process_sent_ch(s, "sp")),
+        ("process_sent sp", gigaword_es.process_sent, reference_process_sent_sp),
+        ("cleanup en", lambda s: cleanup(s, "en"), lambda s: reference_cleanup(s, "en")),
+        ("cleanup ch", lambda s: cleanup(s, "ch"), lambda s: reference_cleanup(s, "ch")),
+        ("cleanup sp", lambda s: cleanup(s, "sp"), lambda s: reference_cleanup(s, "sp")),
+    ]
+
+    failures = 0
+    rng = random.Random(123)
+    sentences = [random_sentence(rng, rng.randint(0, 12)) for _ in range(n_random)]
+    print("{} random cases are being tested".format(len(sentences)))
+    for name, function, reference in cases:
+        for sent in sentences:
+            # str as read from the corpus files, unicode as read back from json
+            for s in [sent, sent.decode("utf-8")]:
+                output = function(s)
+                desired = reference(s)
+                if output != desired or type(output) != type(desired):
+                    print("====== TEST FAILED ======" + "\ncleanup: " + name + "\nsentence: " + repr(s) +
+                          "\nactual output: " + repr(output) + "\ndesired output: " + repr(desired))
+                    failures += 1
+
+    batch = [sent.decode("utf-8") for sent in sentences if len(sent.strip()) > 0]
+    if cleanup_batch(batch, "en") != [reference_cleanup(s.strip(), "en") for s in batch]:
+        print("====== TEST FAILED ======\ncleanup_batch")
+        failures += 1
+
+    if failures == 0:
+        print("All tests passed.")
+
+
+def benchmark(n_sentences):
+    rng = random.Random(123)
+    # mostly plain sentences, like the corpora
+    plain = ["据报导,上个月细螺旋体病已感染了四千八百八十九人,并且造成一百六十五人丧生。",
+             "新华社北京(Xinhua)电 「今天」 国务院 2 日 召开 会议。",
+             "El gobierno anunció hoy que &quot;no habrá cambios&quot; en la política económica."]
+    sentences = [rng.choice(plain) if rng.random() < 0.9 else random_sentence(rng, 20) for _ in range(n_sentences)]
+    english = [" ".join(["he said that", "i", "would", "go", "there", "because", "it", "is", "raining"]) for _ in range(n_sentences)]
+
+    for name, function, reference, data in [
+        ("process_sent ch", gigaword_cn.process_sent, reference_process_sent_ch, sentences),
+        ("process_sent sp", gigaword_es.process_sent, reference_process_sent_sp, sentences),
+        ("cleanup en", lambda s: cleanup(s, "en"), lambda s: reference_cleanup(s, "en"), english),
+    ]:
+        start = time.time()
+        for s in data:
+            reference(s)
+        reference_time = time.time() - start
+        start = time.time()
+        for s in data:
+            function(s)
+        print("{}: {} sentences, reference {:.2f}s, precompiled {:.2f}s".format(
+            name, len(data), reference_time, time.time() - start))
+
+
+if __name__ == '__main__':
+    args = setup_args()
+    test(args.random_cases)
+    if args.benchmark:
+        benchmark(args.benchmark_sentences)
@@ -0,0 +1,202 @@
+# -*- coding: utf-8 -*-
+
+"""
+HTTP plumbing for the CoreNLP server (see https://github.com/erindb/corenlp-ec2-startup)
+
+Every process keeps one keep-alive session, so consecutive parses reuse
+the same TCP connections instead of paying connection setup and teardown
+for every sentence.
+
+Requests for a language are spread over all of its servers
+(CORENLP_ENDPOINTS in cfg.py). A server that keeps failing is taken out
+of rotation for a while and gets another chance once that time is up.
+When none of them answers, a request waits that long and tries them all
+again before it fails.
+"""
+
+import os
+import time
+import logging
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from cfg import CORENLP_POOL_SIZE, CORENLP_ENDPOINTS, CORENLP_BALANCE
+from cfg import CORENLP_MAX_FAILURES, CORENLP_RETRY_AFTER, CORENLP_RETRIES, CORENLP_TIMEOUT
+
+logger = logging.getLogger(__name__)
+
+_session = None
+_session_pid = None
+_pool_size = CORENLP_POOL_SIZE
+
+_endpoint_pools = {}
+
+
+def set_pool_size(pool_size):
+    """
+    Number of keep-alive connections held per CoreNLP server.
+    Should be at least the number of requests we keep in flight.
+    """
+    global _pool_size
+    if pool_size != _pool_size:
+        _pool_size = pool_size
+        close_session()
+
+
+def get_session():
+    global _session, _session_pid
+
+    # a forked worker must not share sockets with its parent,
+    # so the session is rebuilt whenever the pid changes
+    pid = os.getpid()
+    if _session is None or _session_pid != pid:
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=_pool_size, pool_maxsize=_pool_size)
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        _session = session
+        _session_pid = pid
+
+    return _session
+
+
+def close_session():
+    global _session, _session_pid
+    if _session is not None and _session_pid == os.getpid():
+        _session.close()
+    _session = None
+    _session_pid = None
+
+
+class Endpoint(object):
+    def __init__(self, url):
+        self.url = url.rstrip("/")
+        self.outstanding = 0
+        self.failures = 0
+        # out of rotation until this time
+        self.down_until = 0
+
+
+class EndpointPool(object):
+    def __init__(self, urls, balance=CORENLP_BALANCE, max_failures=CORENLP_MAX_FAILURES,
+                 retry_after=CORENLP_RETRY_AFTER, retries=CORENLP_RETRIES):
+        """
+        :param retry_after: seconds a failing server is out of rotation, and a request
+            waits when no server answers
+        :param retries: times a request waits and tries every server again before failing
+        """
+        assert balance in ["round_robin", "least_outstanding"]
+        assert len(urls) > 0
+
+        self.endpoints = [Endpoint(url) for url in urls]
+        self.balance = balance
+        self.max_failures = max_failures
+        self.retry_after = retry_after
+        self.retries = retries
+
+        self.lock = threading.Lock()
+        self.turn = 0
+
+    def acquire(self, exclude=()):
+        with self.lock:
+            now = time.time()
+            candidates = [e for e in self.endpoints if e not in exclude]
+            healthy = [e for e in candidates if e.down_until <= now]
+            if len(healthy) == 0:
+                # everybody is down, rather than give up try the one that comes back first
+                healthy = [min(candidates, key=lambda e: e.down_until)]
+
+            if self.balance == "least_outstanding":
+                fewest = min(e.outstanding for e in healthy)
+                healthy = [e for e in healthy if e.outstanding == fewest]
+
+            # rotate, among the least busy servers in the least_outstanding case
+            endpoint = healthy[self.turn % len(healthy)]
+            self.turn += 1
+
+            endpoint.outstanding += 1
+            return endpoint
+
+    def release(self, endpoint, ok=True):
+        with self.lock:
+            endpoint.outstanding -= 1
+            if ok:
+                if endpoint.failures >= self.max_failures:
+                    logger.info("corenlp server {} is back".format(endpoint.url))
+                endpoint.failures = 0
+                endpoint.down_until = 0
+            else:
+                endpoint.failures += 1
+                if endpoint.failures >= self.max_failures:
+                    if endpoint.failures == self.max_failures:
+                        logger.warning("taking corenlp server {} out of rotation".format(endpoint.url))
+                    endpoint.down_until = time.time() + self.retry_after
+
+    def post(self, query, data):
+        """
+        Only connection errors and timeouts count against a server; an error
+        response means the server is up but didn't like this input.
+        Once every server has failed, wait retry_after seconds and go over them
+        again, up to `retries` times, then raise the last error.
+        """
+        tried = []
+        retries = 0
+        while True:
+            endpoint = self.acquire(exclude=tried)
+            try:
+                response = get_session().post(endpoint.url + query, data=data, timeout=CORENLP_TIMEOUT)
+            except (requests.ConnectionError, requests.Timeout):
+                self.release(endpoint, ok=False)
+                tried.append(endpoint)
+                if len(tried) == len(self.endpoints):
+                    if retries == self.retries:
+                        raise
+                    retries += 1
+                    logger.warning("no corenlp server is answering, trying again in {}s".format(self.retry_after))
+                    time.sleep(self.retry_after)
+                    tried = []
+                continue
+            self.release(endpoint)
+            return response
+
+    def check(self, query, data):
+        """
+        Send a request to every server, those that don't answer are taken out of rotation
+
+        :return: urls of the servers that did not answer
+        """
+        down = []
+        for endpoint in self.endpoints:
+            try:
+                get_session().post(endpoint.url + query, data=data, timeout=CORENLP_TIMEOUT)
+            except (requests.ConnectionError, requests.Timeout):
+                logger.warning("corenlp server {} is not answering".format(endpoint.url))
+                with self.lock:
+                    endpoint.failures = max(endpoint.failures, self.max_failures)
+                    endpoint.down_until = time.time() + self.retry_after
+                down.append(endpoint.url)
+        return down
+
+
+def normalize_lang(lang):
+    if lang == "es":
+        return "sp"
+    return lang
+
+
+def set_endpoints(lang, urls, balance=CORENLP_BALANCE, retry_after=CORENLP_RETRY_AFTER, retries=CORENLP_RETRIES):
+    _endpoint_pools[normalize_lang(lang)] = EndpointPool(urls, balance=balance, retry_after=retry_after,
+                                                         retries=retries)
+
+
+def get_endpoint_pool(lang):
+    lang = normalize_lang(lang)
+    if lang not in _endpoint_pools:
+        _endpoint_pools[lang] = EndpointPool(CORENLP_ENDPOINTS[lang])
+    return _endpoint_pools[lang]
+
+
+def post(lang, query, data):
+    return get_endpoint_pool(lang).post(query, data)
@@ -17,9 +17,12 @@ import os
 from os.path import join as pjoin
 
 import json
-from itertools import izip
+from itertools import izip, izip_longest
 
 from copy import deepcopy as cp
+from util import MarkerScanner, hash_split
+from external_shuffle import ExternalShuffle
+from length_filter import LengthFilter
 
 np.random.seed(123)
 
@@ -62,6 +65,8 @@ def setup_args():
     glove_dir = os.path.join("data", "glove.6B")
     parser.add_argument("--dataset", default="wikitext-103", type=str)
     parser.add_argument("--train_size", default=0.9, type=float)
+    parser.add_argument("--split_mode", default="shuffle", type=str,
+                        help="shuffle|hash, hash puts each pair in a split by a hash of its sentences, stable as the corpus grows")
     parser.add_argument("--glove_dir", default=glove_dir)
     parser.add_argument("--method", default="string_ssplit_int_init", type=str)
     parser.add_argument("--caching", action='store_true')
@@ -658,6 +663,7 @@ def collect_raw_sentences(source_dir, dataset, caching):
         raise Exception("not implemented")
 
     sentences = {marker: {"sentence": [], "previous": []} for marker in DISCOURSE_MARKERS}
+    scanner = MarkerScanner(DISCOURSE_MARKERS, lowercase=True)
     
     for filename in filenames:
         print("reading {}".format(filename))
@@ -678,15 +684,9 @@ def collect_raw_sentences(source_dir, dataset, caching):
         previous_sentence = ""
         for sentence in sent_list:
             words = rephrase(sentence).split()  # replace "for example"
-            for marker in DISCOURSE_MARKERS:
-                if marker == "for example":
-                    proxy_marker = "for_example" 
-                else:
-                    proxy_marker = marker
-
-                if proxy_marker in [w.lower() for w in words]:
-                    sentences[marker]["sentence"].append(sentence)
-                    sentences[marker]["previous"].append(previous_sentence)
+            for marker in scanner.scan(words):
+                sentences[marker]["sentence"].append(sentence)
+                sentences[marker]["previous"].append(previous_sentence)
             previous_sentence = sentence
 
     print('writing files')
@@ -708,7 +708,35 @@ def collect_raw_sentences(source_dir, dataset, caching):
         "commit: \n\ncommand: \n\nmarkers:\n" + statistics_report
     )
 
-def split_raw(source_dir, train_size):
+def hash_split_marker(input_dir, output_dir, marker, train_size):
+    """
+    split_raw for one marker, a line at a time: each pair goes to the split of its
+    (sentence, previous sentence), see util.hash_split
+    :return: number of pairs in each split
+    """
+    test_proportion = (1-train_size)/2
+    split_proportions = {"train": train_size, "valid": test_proportion, "test": test_proportion}
+
+    counts = {split: 0 for split in ["train", "valid", "test"]}
+    write_files = {}
+    for split in counts:
+        for sentence_type in ["s", "prev"]:
+            write_path = pjoin(output_dir, "{}_{}_{}.txt".format(split, marker, sentence_type))
+            write_files[(split, sentence_type)] = open(write_path, "w")
+
+    with open(pjoin(input_dir, "{}_s.txt".format(marker)), "rU") as sentences, \
+            open(pjoin(input_dir, "{}_prev.txt".format(marker)), "rU") as previous_sentences:
+        for sentence, previous in izip(sentences, previous_sentences):
+            split = hash_split(split_proportions, sentence, previous)
+            write_files[(split, "s")].write(sentence)
+            write_files[(split, "prev")].write(previous)
+            counts[split] += 1
+
+    for write_file in write_files.values():
+        write_file.close()
+    return counts
+
+def split_raw(source_dir, train_size, split_mode="shuffle"):
     assert(train_size < 1 and train_size > 0)
 
     markers_dir = pjoin(source_dir, "markers_" + DISCOURSE_MARKER_SET_TAG)
@@ -723,6 +751,12 @@ def split_raw(source_dir, train_size):
 
     statistics_lines = []
     for marker in DISCOURSE_MARKERS:
+        if split_mode == "hash":
+            counts = hash_split_marker(input_dir, output_dir, marker, train_size)
+            for split in counts:
+                statistics_lines.append("{}\t{}\t{}".format(split, marker, counts[split]))
+            continue
+
         sentences = open(pjoin(input_dir, "{}_s.txt".format(marker)), "rU").readlines()
         previous_sentences = open(pjoin(input_dir, "{}_prev.txt".format(marker)), "rU").readlines()
         assert(len(sentences)==len(previous_sentences))
@@ -790,49 +824,35 @@ def ssplit(method, source_dir, train_size):
     def get_data(split, marker, sentence_type):
         filename = "{}_{}_{}.txt".format(split, marker, sentence_type)
         file_path = pjoin(input_dir, filename)
-        return open(file_path, "rU").readlines()
+        return open(file_path, "rU")
 
-    # (a dictionary {train: {...}, valid: {...}, test: {...}})
-    splits = {}
     for split in ["train", "valid", "test"]:
         print("extracting {}".format(split))
-        data = {"s1": [], "s2": [], "label": []}
+        # randomize the order at this point, on disk rather than in memory
+        shuffled = ExternalShuffle(seed=np.random.randint(2**31), tmp_dir=output_dir)
         for marker in DISCOURSE_MARKERS:
-            sentences = get_data(split, marker, "s")
-            previous = get_data(split, marker, "prev")
-            assert(len(sentences) == len(previous))
-            for i in range(len(sentences)):
-                sentence = sentences[i]
-                previous_sentence = previous[i]
-                s1, s2, label = methods[method](sentence, previous_sentence, marker)
-                data["label"].append(marker)
-                data["s1"].append(s1)
-                data["s2"].append(s2)
-        splits[split] = data
-
-    for split in splits:
-        print("randomizing {}".format(split))
-        # randomize the order at this point
-        labels = splits[split]["label"]
-        s1 = splits[split]["s1"]
-        s2 = splits[split]["s2"]
-
-        assert(len(labels) == len(s1) and len(s1) == len(s2))
-        indices = range(len(labels))
-        np.random.shuffle(indices)
+            with get_data(split, marker, "s") as sentences, get_data(split, marker, "prev") as previous:
+                for sentence, previous_sentence in izip_longest(sentences, previous):
+                    assert(sentence is not None and previous_sentence is not None)
+                    s1, s2, label = methods[method](sentence, previous_sentence, marker)
+                    shuffled.add((marker, s1, s2))
 
         print("writing {}".format(split))
+        write_files = {}
         for element_type in ["label", "s1", "s2"]:
             filename = "{}_{}_{}.txt".format(method, split, element_type)
-            file_path = pjoin(output_dir, filename)
-            with open(file_path, "w") as write_file:
-                for index in indices:
-                    element = splits[split][element_type][index]
-                    write_file.write(element + "\n")
+            write_files[element_type] = open(pjoin(output_dir, filename), "w")
+        for label, s1, s2 in shuffled:
+            write_files["label"].write(label + "\n")
+            write_files["s1"].write(s1 + "\n")
+            write_files["s2"].write(s2 + "\n")
+        for write_file in write_files.values():
+            write_file.close()
 
 def filtering(source_dir, args):
 
-    args.min_ratio = 1/args.max_ratio
+    # lengths and ratio within (min, max), bounds excluded
+    length_filter = LengthFilter(args.min_seq_len, args.max_seq_len, args.max_ratio, closed="neither")
 
     marker_dir = pjoin(source_dir, "markers_" + DISCOURSE_MARKER_SET_TAG)
     split_dir = pjoin(marker_dir, "split_train{}".format(args.train_size))
@@ -872,20 +892,14 @@ def filtering(source_dir, args):
         s2s = get_data("s2", split)
         labels = get_data("label", split)
         assert(len(s1s) == len(s2s) and len(s2s) == len(labels))
-        for i in range(len(s1s)):
+        for i in length_filter.filter_pairs(s1s, s2s):
             s1 = s1s[i][:-1]
             s2 = s2s[i][:-1]
             label = labels[i][:-1]
-            len1 = len(s1.split())
-            len2 = len(s2.split())
-            ratio = float(len2)/len1
-            if args.min_seq_len<len1 and len1<args.max_seq_len \
-                    and args.min_seq_len<len2 and len2<args.max_seq_len \
-                    and args.min_ratio<ratio and ratio<args.max_ratio:
-                keep["s1"].append(s1)
-                keep["s2"].append(s2)
-                keep["label"].append(label)
-                frequencies[split][label] += 1
+            keep["s1"].append(s1)
+            keep["s2"].append(s2)
+            keep["label"].append(label)
+            frequencies[split][label] += 1
 
         # write new filtered files
         for element_type in ["s1", "s2", "label"]:
@@ -1293,7 +1307,7 @@ if __name__ == '__main__':
     if args.action == "collect_raw":
         collect_raw_sentences(source_dir, args.dataset, args.caching)
     elif args.action == "split":
-        split_raw(source_dir, args.train_size)
+        split_raw(source_dir, args.train_size, args.split_mode)
     elif args.action == "ssplit":
         ssplit(args.method, source_dir, args.train_size)
     elif args.action == "filtering":
@@ -4,6 +4,9 @@ import sys
 reload(sys)
 sys.setdefaultencoding('utf8')
 
+from parse_record import RELATIONS
+from util import to_unicode
+
 # grab test cases
 ch_dependency_patterns = {
   # and
@@ -128,4 +131,59 @@ en_dependency_patterns = {
   "when": [
     {"S1": "advcl", "S2": "advmod", "POS": "WRB"},
   ],
-}
\ No newline at end of file
+}
+
+def substrings(s):
+    return set(s[i:j] for i in range(len(s) + 1) for j in range(i, len(s) + 1))
+
+
+class DependencyPattern(object):
+    """
+    One entry of the tables above, compiled once so that matching a sentence
+    doesn't go back to the dict for every key.
+    """
+    __slots__ = ["marker", "head", "pos_tags", "n_marker_words", "s1_relation", "s2_relation",
+                 "flip", "s1_before_s2"]
+
+    def __init__(self, marker, pattern):
+        self.marker = marker
+        # unicode, like the words of a parse: a utf-8 str head isn't found in a dict of them
+        self.head = to_unicode(pattern.get("head", marker))
+        # "POS" has always been matched with `in` on a string, i.e. as a substring
+        # (a "CONJ" pattern also takes "SCONJ" tokens), so keep every substring of it
+        self.pos_tags = substrings(pattern["POS"])
+        self.n_marker_words = len(marker.split(" "))
+        self.s1_relation = RELATIONS.id(pattern["S1"])
+        self.s2_relation = RELATIONS.id(pattern["S2"])
+        self.flip = bool(pattern.get("flip", False))
+        self.s1_before_s2 = pattern.get("acceptable_order") == "S1 S2"
+
+
+def compile_patterns(dependency_patterns):
+    """
+    :return: dict of marker -> list of DependencyPattern, in the order of the table
+    """
+    return {marker: [DependencyPattern(marker, pattern) for pattern in patterns]
+            for marker, patterns in dependency_patterns.items()}
+
+
+def index_heads(compiled_patterns):
+    """
+    :return: dict of head word -> markers having a pattern with that head
+    """
+    heads = {}
+    for marker, patterns in compiled_patterns.items():
+        for pattern in patterns:
+            markers = heads.setdefault(pattern.head, [])
+            if marker not in markers:
+                markers.append(marker)
+    return heads
+
+
+compiled_dependency_patterns = {
+    "en": compile_patterns(en_dependency_patterns),
+    "ch": compile_patterns(ch_dependency_patterns),
+    "sp": compile_patterns(sp_dependency_patterns),
+}
+
+marker_heads = {lang: index_heads(patterns) for lang, patterns in compiled_dependency_patterns.items()}
@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+
+"""
+Shuffles more records than fit in memory
+
+Records are scattered at random over a number of temporary bucket files as
+they are added; reading them back shuffles one bucket at a time in memory.
+Sending every record to a bucket picked at random and then shuffling each bucket
+gives every order of the records the same odds, just like shuffling the whole list,
+with only about 1 / buckets of the records in memory at once.
+"""
+
+import os
+import random
+import shutil
+import marshal
+import tempfile
+from os.path import join as pjoin
+
+
+class ExternalShuffle(object):
+    """
+    Records are anything marshal takes: str, unicode, tuples of them...
+
+        shuffled = ExternalShuffle(seed=123)
+        for line in lines:
+            shuffled.add(line)
+        for line in shuffled:
+            ...
+
+    The records can only be read back once, the bucket files are removed as they are read.
+    """
+    def __init__(self, buckets=64, seed=None, tmp_dir=None):
+        """
+        :param seed: the same records added in the same order come back in the same order
+        :param tmp_dir: directory the bucket files are made in, the system default if None
+        """
+        self.rng = random.Random(seed)
+        self.dir = tempfile.mkdtemp(prefix="shuffle.", dir=tmp_dir)
+        self.paths = [pjoin(self.dir, str(i)) for i in range(buckets)]
+        self.files = [open(path, 'wb') for path in self.paths]
+        self.counts = [0] * buckets
+
+    def add(self, record):
+        i = int(self.rng.random() * len(self.files))
+        marshal.dump(record, self.files[i])
+        self.counts[i] += 1
+
+    def __len__(self):
+        return sum(self.counts)
+
+    def __iter__(self):
+        """
+        :yields: the records, in random order
+        """
+        for f in self.files:
+            f.close()
+        try:
+            for path, count in zip(self.paths, self.counts):
+                with open(path, 'rb') as f:
+                    bucket = [marshal.load(f) for _ in range(count)]
+                os.remove(path)
+                self.rng.shuffle(bucket)
+                for record in bucket:
+                    yield record
+        finally:
+            self.close()
+
+    def close(self):
+        for f in self.files:
+            f.close()
+        shutil.rmtree(self.dir, ignore_errors=True)
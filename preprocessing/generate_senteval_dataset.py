@@ -17,6 +17,7 @@ import numpy as np
 from model.data import get_dis
 from preprocessing.cfg import EN_FIVE_DISCOURSE_MARKERS, \
     EN_EIGHT_DISCOURSE_MARKERS, EN_DISCOURSE_MARKERS, EN_OLD_FIVE_DISCOURSE_MARKERS, EN_DIS_FIVE
+from preprocessing.util import hash_split_indices
 
 parser = argparse.ArgumentParser(description='NLI training')
 parser.add_argument("--corpus", type=str, default='books_5',
@@ -27,6 +28,8 @@ parser.add_argument("--senteval", type=str, default='/home/erindb/SentEval/data/
 parser.add_argument("--merge", action='store_false', help="by default, we merge test and dev")
 parser.add_argument("--subset", action='store_true', help="use a higher quality subset of 5 discourse markers")
 parser.add_argument("--train_size", default=0.9, type=float)
+parser.add_argument("--split_mode", type=str, default="shuffle",
+                    help="shuffle|hash, hash puts each example in a split by a hash of (s1, s2), stable as the corpus grows")
 parser.add_argument("--seed", type=int, default=1234, help="seed")
 
 params, _ = parser.parse_known_args()
@@ -100,10 +103,15 @@ def write_to_senteval_format(valid, test):
     assignments = range(num_examples)
     np.random.shuffle(assignments)
 
-    train_numbers = assignments[:int(np.rint(num_examples * split_proportions['train']))]
-    valid_numbers = assignments[int(np.rint(num_examples * split_proportions['train'])): int(
-        np.rint(num_examples * (split_proportions['train'] + split_proportions['valid'])))]
-    test_numbers = assignments[int(np.rint(num_examples * (split_proportions['train'] + split_proportions['valid']))):]
+    if params.split_mode == "hash":
+        splits = hash_split_indices(((merged['s1'][a], merged['s2'][a]) for a in assignments), split_proportions)
+        train_numbers, valid_numbers, test_numbers = [[assignments[i] for i in splits[split]]
+                                                      for split in ["train", "valid", "test"]]
+    else:
+        train_numbers = assignments[:int(np.rint(num_examples * split_proportions['train']))]
+        valid_numbers = assignments[int(np.rint(num_examples * split_proportions['train'])): int(
+            np.rint(num_examples * (split_proportions['train'] + split_proportions['valid'])))]
+        test_numbers = assignments[int(np.rint(num_examples * (split_proportions['train'] + split_proportions['valid']))):]
 
     write_to_file('s1.train', merged['s1'], train_numbers)
     write_to_file('s2.train', merged['s2'], train_numbers)
@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+
+"""
+Extracts the paragraphs of the "story" documents from the gigaword .gz files
+
+Files are decompressed a chunk at a time and read a line at a time and paragraphs are written
+out as soon as they end, so memory stays at one read buffer per process
+however large the corpus. News sources can be extracted by several processes,
+each into its own file; these are concatenated in source order afterwards,
+so the result doesn't depend on the number of processes.
+"""
+
+import os
+import zlib
+import shutil
+import logging
+from multiprocessing import Pool
+from os.path import join as pjoin
+
+logger = logging.getLogger(__name__)
+
+
+def extract_stories(lines, process_sent):
+    """
+    :param lines: lines of a gigaword xml file, without their "\\n"
+    :param process_sent: function cleaning up the text of a paragraph
+    :yields: the paragraphs of the story documents
+    """
+    story_doc = False
+    paragraph = False
+    paragraph_text = []
+    for line in lines:
+        if 'DOC' in line and 'type="story"' in line:
+            story_doc = True
+        if '<P>' in line and story_doc:
+            paragraph = True
+            continue
+        if '</P>' in line and story_doc:
+            paragraph = False
+            sentence = "".join(paragraph_text).strip()
+            # preprocess the sentence
+            yield process_sent(sentence)
+            paragraph_text = []
+        if '</DOC>' in line and story_doc:
+            story_doc = False
+
+        if paragraph:
+            paragraph_text.append(line)
+
+
+def gz_lines(path, chunk_size=1 << 16):
+    """
+    :yields: the lines of a .gz file, decompressed a chunk at a time
+    """
+    with open(path, 'rb') as f:
+        # 16 + MAX_WBITS: expect a gzip header
+        decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        tail = ""
+        pending = ""
+        while True:
+            if not pending:
+                pending = f.read(chunk_size)
+                if not pending:
+                    break
+            # bound the output too, text compresses well and a chunk can inflate a lot
+            data = decompressor.decompress(pending, 16 * chunk_size)
+            pending = decompressor.unconsumed_tail
+            if decompressor.unused_data:
+                # a .gz file can be several gzip members one after the other
+                pending = decompressor.unused_data
+                data += decompressor.flush()
+                decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+            lines = (tail + data).split('\n')
+            tail = lines.pop()
+            for line in lines:
+                yield line
+        tail += decompressor.flush()
+        if tail:
+            yield tail
+
+
+def news_source_files(source_dir, news_source):
+    files = os.listdir(pjoin(source_dir, 'data', news_source))
+    return [pjoin(source_dir, 'data', news_source, file) for file in files if '.gz' in file]
+
+
+def extract_news_source(job):
+    """
+    :return: (number of files, number of paragraphs) extracted
+    """
+    source_dir, news_source, output_path, process_sent = job
+    n_files, n_paragraphs = 0, 0
+    with open(output_path, 'wb') as out:
+        for path in news_source_files(source_dir, news_source):
+            for sent in extract_stories(gz_lines(path), process_sent):
+                out.write(sent + '\n')
+                n_paragraphs += 1
+            n_files += 1
+    return n_files, n_paragraphs
+
+
+def extract_gigaword(source_dir, output_file, process_sent, processes=1):
+    """
+    Extract every news source under source_dir/data into source_dir/output_file
+
+    :param process_sent: function cleaning up the text of a paragraph,
+        must be a module level function so that it can be sent to the worker processes
+    """
+    news_sources = os.listdir(pjoin(source_dir, 'data'))
+    output_path = pjoin(source_dir, output_file)
+
+    if processes <= 1:
+        articles_processed = 0
+        paragraphs = 0
+        with open(output_path, 'wb') as out:
+            for news_source in news_sources:
+                for path in news_source_files(source_dir, news_source):
+                    for sent in extract_stories(gz_lines(path), process_sent):
+                        out.write(sent + '\n')
+                        paragraphs += 1
+                    articles_processed += 1
+                    if articles_processed % 20 == 0:
+                        logger.info("processed {} articles".format(articles_processed))
+                        logger.info("{} paragraphs are collected".format(paragraphs))
+        return
+
+    jobs = [(source_dir, news_source, "{}.{}".format(output_path, news_source), process_sent)
+            for news_source in news_sources]
+    logger.info("extracting {} news sources on {} processes".format(len(jobs), processes))
+
+    pool = Pool(processes)
+    try:
+        # in source order, as they finish
+        for i, (n_files, n_paragraphs) in enumerate(pool.imap(extract_news_source, jobs)):
+            logger.info("{}: {} paragraphs from {} articles".format(jobs[i][1], n_paragraphs, n_files))
+    finally:
+        pool.close()
+        pool.join()
+
+    with open(output_path, 'wb') as out:
+        for job in jobs:
+            part_path = job[2]
+            with open(part_path, 'rb') as part:
+                shutil.copyfileobj(part, out, 1 << 20)
+            os.remove(part_path)
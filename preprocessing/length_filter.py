@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+
+"""
+The length conditions on sentences and (s1, s2) pairs, in one place
+
+The filter stage of the corpora, producer.py and data_gen.py all keep what is
+between min_seq_len and max_seq_len tokens long and, for pairs, has a length ratio
+between 1 / max_ratio and max_ratio. They differ in whether the bounds themselves
+are kept, and in what a token is: a word, or a character for Chinese.
+
+The length of a sentence is counted once; a batch of lengths is then checked
+with numpy masks instead of a chain of comparisons per example.
+"""
+
+import numpy as np
+
+
+class LengthFilter(object):
+    def __init__(self, min_seq_len, max_seq_len, max_ratio=None, closed="both", chars=False):
+        """
+        :param max_ratio: bound on len(s1) / len(s2) and len(s2) / len(s1), None for no ratio condition
+        :param closed: which bounds are kept: "both", "left" ([min, max)) or "neither"
+        :param chars: count characters (of unicode or utf-8 str) instead of words
+        """
+        assert closed in ["both", "left", "neither"]
+        self.min_seq_len = min_seq_len
+        self.max_seq_len = max_seq_len
+        self.max_ratio = max_ratio
+        self.min_ratio = None if max_ratio is None else 1 / float(max_ratio)
+        self.closed = closed
+        self.chars = chars
+
+    def length(self, sentence):
+        if not self.chars:
+            return len(sentence.split())
+        if isinstance(sentence, unicode):
+            return len(sentence)
+        return len(sentence.decode("utf-8"))
+
+    def lengths(self, sentences):
+        """
+        :return: numpy array of the lengths of the sentences
+        """
+        return np.array([self.length(s) for s in sentences], dtype=np.int64)
+
+    def within(self, values, low, high):
+        """
+        :param values: a number or a numpy array
+        """
+        if self.closed == "neither":
+            above = values > low
+        else:
+            above = values >= low
+        if self.closed == "both":
+            below = values <= high
+        else:
+            below = values < high
+        return above & below
+
+    def keep_lengths(self, length1, length2=None):
+        """
+        :return: True if a sentence of length1 tokens, or a pair of length1 and length2 tokens, is kept
+        """
+        if not self.within(length1, self.min_seq_len, self.max_seq_len):
+            return False
+        if length2 is None:
+            return True
+        if not self.within(length2, self.min_seq_len, self.max_seq_len):
+            return False
+        if self.max_ratio is None:
+            return True
+        return self.within(float(length1) / max(length2, 0.0001), self.min_ratio, self.max_ratio)
+
+    def keep(self, s1, s2=None):
+        """
+        :return: True if the sentence s1, or the pair (s1, s2), is kept
+        """
+        return self.keep_lengths(self.length(s1), None if s2 is None else self.length(s2))
+
+    def mask(self, lengths1, lengths2=None):
+        """
+        keep_lengths over arrays of lengths
+
+        :return: numpy boolean array, True for what is kept
+        """
+        lengths1 = np.asarray(lengths1)
+        keep = self.within(lengths1, self.min_seq_len, self.max_seq_len)
+        if lengths2 is None:
+            return keep
+        lengths2 = np.asarray(lengths2)
+        keep &= self.within(lengths2, self.min_seq_len, self.max_seq_len)
+        if self.max_ratio is not None:
+            keep &= self.within(lengths1 / np.maximum(lengths2, 0.0001), self.min_ratio, self.max_ratio)
+        return keep
+
+    def filter_pairs(self, s1s, s2s):
+        """
+        :return: indices of the pairs (s1s[i], s2s[i]) kept
+        """
+        return np.flatnonzero(self.mask(self.lengths(s1s), self.lengths(s2s)))
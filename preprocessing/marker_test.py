@@ -0,0 +1,108 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Checks discourse marker matching on non-ascii Spanish markers: find_markers with
+sentences given as unicode (like the filter stage reads them) and as utf-8 str,
+and find_pair / find_pairs on parses with unicode words (like corenlp returns them).
+"""
+
+import sys
+import json
+import argparse
+
+from gigaword_es import GigawordSpanishReader
+from parser import Sentence
+
+reload(sys)
+sys.setdefaultencoding('utf8')
+
+# (sentence, markers found, in the order of SP_DISCOURSE_MARKERS)
+find_markers_cases = [
+    ("además , el perro también corre y come", ["y", "también", "además"]),
+    ("antes de comer , después también tenía hambre", ["antes", "después", "también"]),
+    ("no vino por eso , y después se fue", ["y", "por eso", "después"]),
+    ("el perro corre en el parque", []),
+]
+
+# (marker, relation of S1): "el perro come ; <marker> el gato duerme ."
+find_pair_cases = [
+    ("además", "parataxis"),
+    ("también", "parataxis"),
+    ("después", "advcl"),
+]
+
+
+def sp_parse(marker, s1_relation):
+    """
+    :return: the corenlp json of "el perro come ; <marker> el gato duerme ."
+    """
+    tokens = [("el", "DET"), ("perro", "NOUN"), ("come", "VERB"), (";", "PUNCT"), (marker, "ADV"),
+              ("el", "DET"), ("gato", "NOUN"), ("duerme", "VERB"), (".", "PUNCT")]
+    dependencies = [(0, 3, "ROOT"), (2, 1, "det"), (3, 2, "nsubj"), (3, 4, "punct"), (3, 8, s1_relation),
+                    (8, 5, "advmod"), (7, 6, "det"), (8, 7, "nsubj"), (3, 9, "punct")]
+    parse = {"tokens": [{"index": i + 1, "word": word, "pos": pos} for i, (word, pos) in enumerate(tokens)],
+             "basicDependencies": [{"governor": governor, "dependent": dependent, "dep": dep}
+                                   for governor, dependent, dep in dependencies]}
+    # through json, so that the words are unicode
+    return json.loads(json.dumps(parse)), " ".join(word for word, _ in tokens)
+
+
+def setup_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--min_seq_len", default=5, type=int)
+    parser.add_argument("--max_seq_len", default=50, type=int)
+    parser.add_argument("--filter_print_every", default=10000, type=int)
+    return parser.parse_args()
+
+
+def test_find_markers(args):
+    reader = GigawordSpanishReader(".", args)
+
+    failed = False
+    for sentence, expected in find_markers_cases:
+        for s in [sentence.decode("utf-8"), sentence]:
+            found = reader.find_markers(s)
+            if found != expected:
+                failed = True
+                print("====== TEST FAILED ======" + "\nsentence: " + repr(s) +
+                      "\nexpected: " + repr(expected) + "\nfound: " + repr(found))
+    return failed
+
+
+def test_find_pair():
+    failed = False
+    for marker, s1_relation in find_pair_cases:
+        parse, sentence = sp_parse(marker, s1_relation)
+        pair = Sentence(parse, sentence, "sp").find_pair(marker, "any", "", lang="sp")
+        pairs = Sentence(parse, sentence, "sp").find_pairs([marker], "any", "", lang="sp")
+        if pair is None or pair[1] != "El gato duerme" or pairs != {marker: pair}:
+            failed = True
+            print("====== TEST FAILED ======" + "\nmarker: " + marker + "\nsentence: " + sentence +
+                  "\nfind_pair: " + repr(pair) + "\nfind_pairs: " + repr(pairs))
+
+    # markers with no dependency pattern don't match, and don't keep the others from matching
+    parse, sentence = sp_parse("además", "parataxis")
+    markers = ["y", "por eso", "además", "por lo cual"]
+    try:
+        pairs = Sentence(parse, sentence, "sp").find_pairs(markers, "any", "", lang="sp")
+    except KeyError as e:
+        pairs = "KeyError: " + repr(e)
+    if not isinstance(pairs, dict) or pairs.keys() != ["además"]:
+        failed = True
+        print("====== TEST FAILED ======" + "\nmarkers: " + repr(markers) + "\nsentence: " + sentence +
+              "\nfind_pairs: " + repr(pairs))
+    return failed
+
+
+def test(args):
+    failed = test_find_markers(args)
+    failed = test_find_pair() or failed
+
+    if not failed:
+        print("All tests passed.")
+
+
+if __name__ == '__main__':
+    args = setup_args()
+    test(args)
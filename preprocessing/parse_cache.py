@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+
+"""
+On-disk cache of dependency parses
+
+Parses are keyed by a hash of (language, annotators, sentence as sent to corenlp),
+so re-running the parse stage, e.g. after editing dep_patterns.py, only costs
+the pattern matching and never goes back to the corenlp server.
+"""
+
+import os
+import zlib
+import sqlite3
+import hashlib
+import threading
+
+from parse_record import ParseRecord
+
+# sqlite only lets us bind this many variables in one statement
+_MAX_VARIABLES = 900
+
+# part of every key, bump it when the stored format changes so old entries are never read back
+PARSE_FORMAT = "record1"
+
+
+def parse_key(sentence, lang, annotators):
+    if isinstance(sentence, unicode):
+        sentence = sentence.encode("utf-8")
+    return hashlib.sha1("\0".join([PARSE_FORMAT, lang, annotators, sentence])).digest()
+
+
+def encode_parse(parse):
+    return zlib.compress(parse.encode())
+
+
+def decode_parse(blob):
+    return ParseRecord.decode(zlib.decompress(blob))
+
+
+class ParseCache(object):
+    """
+    Safe to share between the threads of a process. Every process opens its own
+    connection to the database, so a forked worker never reuses its parent's.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self._connection = None
+        self._connection_pid = None
+
+    def connection(self):
+        pid = os.getpid()
+        if self._connection is None or self._connection_pid != pid:
+            connection = sqlite3.connect(self.path, timeout=60, check_same_thread=False)
+            connection.text_factory = str
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.execute("CREATE TABLE IF NOT EXISTS parses (key BLOB PRIMARY KEY, parse BLOB)")
+            connection.commit()
+            self._connection = connection
+            self._connection_pid = pid
+        return self._connection
+
+    def get_many(self, keys):
+        """
+        :return: dict of key -> ParseRecord for the keys we have
+        """
+        found = {}
+        with self.lock:
+            connection = self.connection()
+            for start in range(0, len(keys), _MAX_VARIABLES):
+                chunk = [sqlite3.Binary(key) for key in keys[start:start + _MAX_VARIABLES]]
+                rows = connection.execute(
+                    "SELECT key, parse FROM parses WHERE key IN ({})".format(",".join("?" * len(chunk))),
+                    chunk
+                )
+                for key, blob in rows:
+                    found[str(key)] = decode_parse(str(blob))
+        return found
+
+    def get(self, key):
+        return self.get_many([key]).get(key)
+
+    def put_many(self, items):
+        """
+        :param items: list of (key, ParseRecord)
+        """
+        rows = [(sqlite3.Binary(key), sqlite3.Binary(encode_parse(parse))) for key, parse in items]
+        if len(rows) == 0:
+            return
+        with self.lock:
+            connection = self.connection()
+            connection.executemany("INSERT OR REPLACE INTO parses (key, parse) VALUES (?, ?)", rows)
+            connection.commit()
+
+    def put(self, key, parse):
+        self.put_many([(key, parse)])
+
+    def __len__(self):
+        with self.lock:
+            return self.connection().execute("SELECT COUNT(*) FROM parses").fetchone()[0]
+
+    def close(self):
+        with self.lock:
+            if self._connection is not None and self._connection_pid == os.getpid():
+                self._connection.close()
+            self._connection = None
+            self._connection_pid = None
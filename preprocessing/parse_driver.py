@@ -0,0 +1,151 @@
+# -*- coding: utf-8 -*-
+
+"""
+Keeps several parse requests in flight at once, so the corenlp server's
+thread pool isn't sitting idle while we wait on a single sentence.
+
+We are on Python 2 (no asyncio), so requests run on a pool of worker threads;
+the socket calls in requests release the GIL while they wait on the server.
+"""
+
+import sys
+import logging
+import threading
+from Queue import Queue
+
+from cfg import PARSE_BATCH_SIZE, PARSE_CONCURRENCY, PARSE_CHECKPOINT_EVERY
+from util import blocks, read_filtered_sentences, drop_repeats
+from checkpoint import Checkpoint
+
+logger = logging.getLogger(__name__)
+
+_DONE = object()
+
+
+class _Failure(object):
+    def __init__(self, exc_info):
+        self.exc_info = exc_info
+
+
+def parse_concurrently(blocks, parse_block, concurrency=PARSE_CONCURRENCY, ordered=False, max_pending=None):
+    """
+    Run parse_block over blocks with up to `concurrency` calls in flight.
+
+    Reading from blocks stops whenever `max_pending` blocks have been handed out
+    but not yet consumed by the caller (backpressure), so memory stays bounded
+    even if the caller writes slowly, or, with ordered=True, while we wait
+    for one slow block.
+
+    :param blocks: iterable of lists of items
+    :param parse_block: function taking a list of items, returning a list of results aligned with it
+    :param ordered: yield blocks in input order rather than as they complete
+    :yields: (item, result)
+    """
+    if max_pending is None:
+        max_pending = 2 * concurrency
+
+    pending = threading.Semaphore(max_pending)
+    todo = Queue(maxsize=concurrency)
+    done = Queue()
+
+    def feed():
+        try:
+            for seq, block in enumerate(blocks):
+                pending.acquire()
+                todo.put((seq, block))
+        except:
+            done.put((None, None, _Failure(sys.exc_info())))
+        for _ in range(concurrency):
+            todo.put(_DONE)
+
+    def work():
+        while True:
+            task = todo.get()
+            if task is _DONE:
+                done.put(_DONE)
+                return
+            seq, block = task
+            try:
+                results = parse_block(block)
+            except:
+                results = _Failure(sys.exc_info())
+            done.put((seq, block, results))
+
+    threads = [threading.Thread(target=feed)] + [threading.Thread(target=work) for _ in range(concurrency)]
+    for thread in threads:
+        # don't keep the interpreter alive on Ctrl-C
+        thread.daemon = True
+        thread.start()
+
+    finished_workers = 0
+    next_seq = 0
+    waiting = {}
+    while finished_workers < concurrency:
+        task = done.get()
+        if task is _DONE:
+            finished_workers += 1
+            continue
+
+        seq, block, results = task
+        if isinstance(results, _Failure):
+            raise results.exc_info[0], results.exc_info[1], results.exc_info[2]
+
+        if not ordered:
+            pending.release()
+            for item, result in zip(block, results):
+                yield item, result
+            continue
+
+        waiting[seq] = (block, results)
+        while next_seq in waiting:
+            block, results = waiting.pop(next_seq)
+            next_seq += 1
+            pending.release()
+            for item, result in zip(block, results):
+                yield item, result
+
+
+def run_parse_stage(input_path, output_path, parse_block, markers=None, batch_size=PARSE_BATCH_SIZE,
+                    concurrency=PARSE_CONCURRENCY, checkpoint_every=PARSE_CHECKPOINT_EVERY,
+                    restart=False, print_every=10000):
+    """
+    Parse the filtered sentences of input_path and write a "s1\ts2\tmarker" line to output_path
+    for every pair found. Progress is checkpointed, and a run that didn't finish is resumed
+    where its last checkpoint left off, unless restart is set.
+
+    :param parse_block: function taking a list of (sentence, previous, markers),
+        returning a list of lists of (s1, s2, marker) aligned with it
+    :param markers: only parse for these markers, all of them by default
+    """
+    checkpoint = Checkpoint(output_path)
+    state = None if restart else checkpoint.load()
+    if state is None:
+        resume_offset, output_size, i = 0, 0, 0
+    else:
+        resume_offset, output_size, i = state["input_offset"], state["output_size"], state["sentences"]
+        logger.info("resuming after {} sentences".format(i))
+
+    with open(output_path, 'ab') as w:
+        # drop whatever was written after the checkpoint, it is about to be written again
+        w.truncate(output_size)
+
+        items = drop_repeats(read_filtered_sentences(input_path, markers, offsets=True))
+        # sentences before the checkpoint are only read again to know which ones are repeats
+        items = (item for item in items if item[3] > resume_offset)
+
+        # in order, so that everything before a checkpoint's offset has been written
+        parsed = parse_concurrently(blocks(items, batch_size),
+                                    lambda block: parse_block([item[:3] for item in block]),
+                                    concurrency=concurrency, ordered=True)
+        offset = resume_offset
+        for (sentence, previous, sentence_markers, offset), pairs in parsed:
+            i += 1
+            for s1, s2, marker in pairs:
+                w.write("{}\t{}\t{}\n".format(s1, s2, marker))
+
+            if i % print_every == 0:
+                logger.info("processed {}".format(i))
+            if i % checkpoint_every == 0:
+                checkpoint.save(w, offset, i)
+
+        checkpoint.save(w, offset, i, done=True)
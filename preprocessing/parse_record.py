@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+
+"""
+Compact representation of a dependency parse
+
+For every sentence the corenlp server sends back a large json object
+(character offsets, original text, enhanced dependencies, ...). We only need
+the words, the POS tags and the basic dependencies, which ParseRecord keeps as
+parallel integer arrays over label tables shared by the whole process.
+This is also the format parses are stored in by the parse cache.
+"""
+
+import json
+import threading
+from array import array
+
+
+class LabelTable(object):
+    """
+    Interns labels (words, POS tags, relation names) as small integers
+    """
+    def __init__(self):
+        self.ids = {}
+        self.labels = []
+        self.lock = threading.Lock()
+
+    def id(self, label):
+        try:
+            return self.ids[label]
+        except KeyError:
+            with self.lock:
+                if label not in self.ids:
+                    # append first, so another thread never sees an id without its label
+                    self.labels.append(label)
+                    self.ids[label] = len(self.labels) - 1
+                return self.ids[label]
+
+    def label(self, id):
+        return self.labels[id]
+
+    def __len__(self):
+        return len(self.labels)
+
+
+WORDS = LabelTable()
+POS_TAGS = LabelTable()
+RELATIONS = LabelTable()
+
+
+class ParseRecord(object):
+    """
+    Tokens are 1-indexed like in corenlp: token i is at position i-1 of words and pos.
+    Dependencies keep the order of corenlp's basicDependencies, ROOT has governor 0.
+    A parse without depparse (tokens and POS tags only) has no dependencies.
+    """
+    __slots__ = ["words", "pos", "governors", "dependents", "relations"]
+
+    def __init__(self, words, pos, governors, dependents, relations):
+        self.words = array('i', words)
+        self.pos = array('i', pos)
+        self.governors = array('i', governors)
+        self.dependents = array('i', dependents)
+        self.relations = array('i', relations)
+
+    @classmethod
+    def from_json(cls, json_sentence):
+        """
+        :param json_sentence: one element of "sentences" in the corenlp server response
+        """
+        tokens = json_sentence["tokens"]
+        # not there when the depparse annotator didn't run
+        dependencies = json_sentence.get("basicDependencies", [])
+        return cls(
+            [WORDS.id(t["word"]) for t in tokens],
+            [POS_TAGS.id(t["pos"]) for t in tokens],
+            [d["governor"] for d in dependencies],
+            [d["dependent"] for d in dependencies],
+            [RELATIONS.id(d["dep"]) for d in dependencies]
+        )
+
+    def encode(self):
+        """
+        Label ids only mean something inside this process, so stored records carry the labels
+        """
+        return json.dumps([
+            [WORDS.labels[w] for w in self.words],
+            [POS_TAGS.labels[p] for p in self.pos],
+            self.governors.tolist(),
+            self.dependents.tolist(),
+            [RELATIONS.labels[r] for r in self.relations]
+        ], separators=(',', ':'))
+
+    @classmethod
+    def decode(cls, encoded):
+        words, pos, governors, dependents, relations = json.loads(encoded)
+        return cls(
+            [WORDS.id(w) for w in words],
+            [POS_TAGS.id(p) for p in pos],
+            governors,
+            dependents,
+            [RELATIONS.id(r) for r in relations]
+        )
+
+    def __len__(self):
+        return len(self.words)
+
+    def __eq__(self, other):
+        return isinstance(other, ParseRecord) and all(
+            getattr(self, field) == getattr(other, field) for field in self.__slots__
+        )
+
+    def __ne__(self, other):
+        return not self == other
+
+    def word(self, index):
+        return WORDS.labels[self.words[index - 1]]
+
+    def pos_tag(self, index):
+        return POS_TAGS.labels[self.pos[index - 1]]
+
+    def relation(self, dependency):
+        return RELATIONS.labels[self.relations[dependency]]
+
+    def word_list(self):
+        labels = WORDS.labels
+        return [labels[w] for w in self.words]
@@ -0,0 +1,193 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Checks that the parse stage stops when the corenlp server goes away, instead of
+taking every sentence for one it couldn't parse: the run raises, the checkpoint
+is left at the last sentences written, and running again parses the rest.
+A server that is back before the requests have waited retry_after seconds
+doesn't stop the run. Also checks that a parse without depparse reads as
+tokens without dependencies.
+
+A stand-in server answers with a flat parse of every sentence, and is shut down
+after a few sentences.
+"""
+
+import sys
+import json
+import time
+import shutil
+import logging
+import argparse
+import tempfile
+import threading
+from os.path import join as pjoin
+from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+
+import requests
+
+import corenlp_client
+from checkpoint import Checkpoint
+from parse_record import ParseRecord
+from parse_driver import run_parse_stage
+from pipeline import dependency_parsing_batch
+from parser import request_parse
+from util import FilteredSentenceWriter
+
+reload(sys)
+sys.setdefaultencoding('utf8')
+
+
+class StubCoreNLPHandler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        sentence = self.rfile.read(int(self.headers["Content-Length"]))
+        self.server.sentences.append(sentence)
+        words = sentence.split()
+        parse = {"tokens": [{"index": i + 1, "word": word, "pos": "NN"} for i, word in enumerate(words)]}
+        # like corenlp, no dependencies unless depparse is one of the annotators
+        if "depparse" in self.path:
+            parse["basicDependencies"] = [{"dep": "ROOT", "governor": 0, "dependent": 1}] + \
+                                         [{"dep": "dep", "governor": 1, "dependent": i + 1} for i in range(1, len(words))]
+        body = json.dumps({"sentences": [parse]})
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def start_server(port=0):
+    server = HTTPServer(("127.0.0.1", port), StubCoreNLPHandler)
+    server.sentences = []
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    return server
+
+
+def use_server(server, retry_after):
+    corenlp_client.set_endpoints("en", ["http://127.0.0.1:{}".format(server.server_port)], retry_after=retry_after)
+
+
+def stop_server(server):
+    server.shutdown()
+    server.server_close()
+
+
+def setup_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sentences", default=6, type=int, help="number of sentences in the parse stage input")
+    parser.add_argument("--stop_after", default=3, type=int, help="the server goes away after this many sentences")
+    parser.add_argument("--retry_after", default=0.5, type=float,
+                        help="seconds a request waits when no server answers, before trying again")
+    return parser.parse_args()
+
+
+def test(n_sentences, stop_after, retry_after):
+    logging.disable(logging.WARNING)
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        input_path = pjoin(tmp_dir, "sentences.jsonl")
+        output_path = pjoin(tmp_dir, "parsed_sentence_pairs.txt")
+        sentences = ["The dog number {} ran because it was late".format(i) for i in range(n_sentences)]
+        with FilteredSentenceWriter(input_path, ["because"]) as writer:
+            previous = "it was late ."
+            for sentence in sentences:
+                writer.write(sentence, previous, ["because"])
+                previous = sentence
+
+        failed = False
+        server = start_server()
+        use_server(server, retry_after)
+        blocks_parsed = [0]
+
+        def parse_block(items):
+            # one sentence a block: the server is gone from sentence stop_after + 1 on
+            if blocks_parsed[0] == stop_after:
+                stop_server(server)
+            blocks_parsed[0] += 1
+            return dependency_parsing_batch(items, "en")
+
+        try:
+            run_parse_stage(input_path, output_path, parse_block, batch_size=1, concurrency=1,
+                            checkpoint_every=1)
+            error = None
+        except (requests.ConnectionError, requests.Timeout) as e:
+            error = e
+
+        # a block already handed to a worker thread is still being tried, let it give up
+        # before a new server (maybe on the same port) is up
+        time.sleep(2 * retry_after)
+
+        checkpoint = Checkpoint(output_path)
+        state = checkpoint.load()
+        if error is None or checkpoint.done or state is None or state["sentences"] != stop_after:
+            failed = True
+            print("====== TEST FAILED ======\nserver gone" + "\nraised: " + repr(error) +
+                  "\ndone: " + repr(checkpoint.done) + "\ncheckpoint: " + repr(state))
+
+        # resumed against a server that is up
+        server = start_server()
+        use_server(server, retry_after)
+        run_parse_stage(input_path, output_path, lambda items: dependency_parsing_batch(items, "en"),
+                        batch_size=1, concurrency=1, checkpoint_every=1)
+        stop_server(server)
+        if not checkpoint.done or server.sentences != sentences[stop_after:]:
+            failed = True
+            print("====== TEST FAILED ======\nresumed" + "\ndone: " + repr(checkpoint.done) +
+                  "\nparsed: " + repr(server.sentences) + "\nexpected: " + repr(sentences[stop_after:]))
+
+        # the server restarts, and is back before the requests are tried again
+        output_path = pjoin(tmp_dir, "restart_parsed_sentence_pairs.txt")
+        servers = [start_server()]
+        use_server(servers[0], retry_after)
+        blocks_parsed = [0]
+
+        def restart_server():
+            servers.append(start_server(servers[0].server_port))
+
+        def parse_block_restart(items):
+            if blocks_parsed[0] == stop_after:
+                stop_server(servers[0])
+                threading.Timer(retry_after / 4, restart_server).start()
+            blocks_parsed[0] += 1
+            return dependency_parsing_batch(items, "en")
+
+        try:
+            run_parse_stage(input_path, output_path, parse_block_restart, batch_size=1, concurrency=1,
+                            checkpoint_every=1)
+            error = None
+        except (requests.ConnectionError, requests.Timeout) as e:
+            error = e
+        parsed = [sentence for server in servers for sentence in server.sentences]
+        if len(servers) > 1:
+            stop_server(servers[1])
+        if error is not None or not Checkpoint(output_path).done or parsed != sentences:
+            failed = True
+            print("====== TEST FAILED ======\nserver restarted" + "\nraised: " + repr(error) +
+                  "\ndone: " + repr(Checkpoint(output_path).done) + "\nparsed: " + repr(parsed))
+
+        # tokens and POS tags only
+        server = start_server()
+        use_server(server, retry_after)
+        try:
+            parse = request_parse(sentences[0], depparse=False)
+        except KeyError as e:
+            parse = "KeyError: " + repr(e)
+        stop_server(server)
+        if not isinstance(parse, ParseRecord) or parse.word_list() != sentences[0].split() or \
+                len(parse.relations) != 0:
+            failed = True
+            print("====== TEST FAILED ======\nwithout depparse" + "\nparse: " + repr(parse))
+
+        if not failed:
+            print("All tests passed.")
+    finally:
+        shutil.rmtree(tmp_dir)
+
+
+if __name__ == '__main__':
+    args = setup_args()
+    test(args.sentences, args.stop_after, args.retry_after)
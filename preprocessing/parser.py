@@ -10,7 +10,6 @@ import numpy as np
 import argparse
 import io
 import pickle
-import requests
 import re
 import logging
 
@@ -18,6 +17,7 @@ import pprint
 pp = pprint.PrettyPrinter(indent=1)
 
 from dep_patterns import en_dependency_patterns, ch_dependency_patterns, sp_dependency_patterns
+from dep_patterns import compiled_dependency_patterns, marker_heads
 
 import sys
 reload(sys)
@@ -28,11 +28,19 @@ from os.path import join as pjoin
 
 import json
 from itertools import izip
+from bisect import bisect_left
+from difflib import SequenceMatcher
 
 from copy import deepcopy as cp
 from cfg import DISCOURSE_MARKER_SET_TAG
 from cfg import EN_DISCOURSE_MARKERS, CH_DISCOURSE_MARKERS, SP_DISCOURSE_MARKERS
-from cfg import EN_PORT, SP_PORT, CH_PORT
+from cfg import CORENLP_BALANCE
+
+import corenlp_client
+from parse_cache import ParseCache, parse_key
+from parse_record import ParseRecord, RELATIONS
+from text_cleanup import PatternSub
+from util import to_unicode
 
 np.random.seed(123)
 
@@ -74,6 +82,8 @@ def setup_args():
 def capitalize(s):
     return s[0].capitalize() + s[1:]
 
+_QUOTED = PatternSub(' " (.*) " ', ' "\\1" ', ' " ')
+
 def cleanup(s, lang="en"):
     s = s.replace(" @-@ ", "-")
     if len(s) > 0:
@@ -84,11 +94,17 @@ def cleanup(s, lang="en"):
       if len(s) > 3:
           if s[0:3] == "im ":
               s = "I'm " + s[3:]
-      s = re.sub(' " (.*) " ', ' "\\1" ', s)
+      s = _QUOTED(s)
     #elif lang == "sp":
     #    s = s.replace(" del ", " de el ")
     return s
 
+def cleanup_batch(sentences, lang="en"):
+    """
+    :return: list of the sentences, stripped and cleaned up
+    """
+    return [cleanup(sentence.strip(), lang) for sentence in sentences]
+
 def standardize_sentence_output(s, lang="en"):
     if len(s) == 0:
         return None
@@ -128,23 +144,6 @@ top_level_deps_to_ignore_if_extra = [
 def is_verb_tag(tag):
     return tag[0] == "V" and not tag[-2:] in ["BG", "BN"]
 
-# https://stackoverflow.com/a/18669080
-def get_indices(lst, element, case="sensitive"):
-  result = []
-  starting_index = -1
-  while True:
-    try:
-        found_index = lst.index(element, starting_index+1)
-        starting_index = found_index
-    except ValueError:
-        return result
-    result.append(found_index)
-
-def get_nearest(lst, element):
-    distances = [abs(e-element) for e in lst]
-    return lst[np.argmin(distances)]
-
-
 def redo_tokenization(lst, lang="en"):
     if lang == "en":
       s = " ".join(lst)
@@ -157,68 +156,137 @@ def redo_tokenization(lst, lang="en"):
       return lst
 
 
-"""
-parsed tokenization is different from original tokenization.
-try to re-align and extract the correct words given the
-extraction_indices (which are 1-indexed into parsed_words)
+class TokenAlignment(object):
+    """
+    parsed tokenization is different from original tokenization.
+    Lines the two up once per sentence, so that every subphrase of it
+    (S1 and S2, for every marker) is extracted from the same index:
+    the positions of each original word, and when that isn't enough,
+    a token to token alignment of the two sequences.
 
-fix me to catch more cases?
-"""
-def extract_subphrase(orig_words, parsed_words, extraction_indices, lang="en"):
-    extraction_indices = [i-1 for i in extraction_indices]
+    :param orig_words: the words of the original sentence
+    :param parsed_words: the words of the parse
+    """
+    def __init__(self, orig_words, parsed_words, lang="en"):
+        self.lang = lang
+        self.parsed_words = parsed_words
+        if lang == "sp":
+            self.orig_words = orig_words
+        else:
+            self.orig_words = redo_tokenization(orig_words, lang=lang)
+        self._positions = None
+        self._parsed_to_orig = None
+
+    def positions(self, word):
+        """
+        :return: the indices of word in the original words, in order
+        """
+        if self._positions is None:
+            self._positions = {}
+            for i, w in enumerate(self.orig_words):
+                self._positions.setdefault(w, []).append(i)
+        return self._positions.get(word, [])
+
+    def nearest(self, word, index):
+        """
+        :return: the index of word in the original words closest to index,
+            the first one on a tie, None if it isn't there
+        """
+        positions = self.positions(word)
+        if not positions:
+            return None
+        i = bisect_left(positions, index)
+        if i == len(positions):
+            return positions[-1]
+        if i > 0 and index - positions[i-1] <= positions[i] - index:
+            return positions[i-1]
+        return positions[i]
+
+    def parsed_to_orig(self):
+        """
+        :return: dict of parsed index -> original index of the words
+            the two tokenizations have in common, in order
+        """
+        if self._parsed_to_orig is None:
+            self._parsed_to_orig = {}
+            matcher = SequenceMatcher(None, self.parsed_words, self.orig_words, autojunk=False)
+            for parsed_start, orig_start, size in matcher.get_matching_blocks():
+                for k in range(size):
+                    self._parsed_to_orig[parsed_start + k] = orig_start + k
+        return self._parsed_to_orig
+
+    def realign(self, first_parse_index, last_parse_index):
+        """
+        The subphrase from the alignment, when its first and last words are in both tokenizations
+        """
+        parsed_to_orig = self.parsed_to_orig()
+        first_orig_index = parsed_to_orig.get(first_parse_index)
+        last_orig_index = parsed_to_orig.get(last_parse_index)
+        if first_orig_index is None or last_orig_index is None:
+            return None
+        return " ".join(self.orig_words[first_orig_index:last_orig_index+1])
 
-    if lang == "sp":
-      return " ".join([parsed_words[i] for i in extraction_indices])
+    def extract(self, extraction_indices):
+        """
+        :param extraction_indices: 1-indexed into parsed_words
+        :return: the subphrase in the original words, None if it can't be lined up
+        """
+        orig_words = self.orig_words
+        parsed_words = self.parsed_words
+        extraction_indices = [i-1 for i in extraction_indices]
 
-    orig_words = redo_tokenization(orig_words, lang=lang)
-    
-    if len(orig_words) == len(parsed_words):
-        return " ".join([orig_words[i] for i in extraction_indices])
-    else:
-        first_parse_index = extraction_indices[0]
-        first_word_indices = get_indices(orig_words, parsed_words[first_parse_index])
+        if self.lang == "sp":
+            return " ".join([parsed_words[i] for i in extraction_indices])
 
-        last_parse_index = extraction_indices[-1]
+        if len(orig_words) == len(parsed_words):
+            return " ".join([orig_words[i] for i in extraction_indices])
 
-        last_word_indices = get_indices(orig_words, parsed_words[last_parse_index])
+        first_parse_index = extraction_indices[0]
+        last_parse_index = extraction_indices[-1]
+        first_orig_index = self.nearest(parsed_words[first_parse_index], first_parse_index)
+        last_orig_index = self.nearest(parsed_words[last_parse_index], last_parse_index)
 
-        if len(first_word_indices)>0 and len(last_word_indices)>0:
-            first_orig_index = get_nearest(first_word_indices, first_parse_index)
-            last_orig_index = get_nearest(last_word_indices, last_parse_index)
+        if first_orig_index is not None and last_orig_index is not None:
             if last_orig_index-first_orig_index == last_parse_index-first_parse_index:
                 # maybe it's just shifted
                 shift = first_orig_index - first_parse_index
                 extraction_indices = [i+shift for i in extraction_indices]
                 return " ".join([orig_words[i] for i in extraction_indices])
-            else:
-                # or maybe there's funny stuff happening inside the subphrase
-                # in which case T-T
+            # or maybe there's funny stuff happening inside the subphrase,
+            # which the alignment sees past
+            subphrase = self.realign(first_parse_index, last_parse_index)
+            if subphrase is None:
                 print "wonky subphrase:"
                 print orig_words
                 print parsed_words
-                return None
-        else:
-            if len(first_word_indices)>0 and abs(last_parse_index-len(parsed_words))<3:
-                # the end of the sentence is always weird. assume it's aligned
-
-                # grab the start of the subphrase
-                first_orig_index = get_nearest(first_word_indices, first_parse_index)
-                # shift if necessary
-                shift = first_orig_index - first_parse_index
-                extraction_indices = [i+shift for i in extraction_indices]
+            return subphrase
 
-                if len(orig_words) > extraction_indices[-1]:
-                    # extend to the end of the sentence if we're not already there
-                    extraction_indices += range(extraction_indices[-1]+1, len(orig_words))
-                else:
-                    extraction_indices = [i for i in extraction_indices if i<len(orig_words)]
+        if first_orig_index is not None and abs(last_parse_index-len(parsed_words))<3:
+            # the end of the sentence is always weird. assume it's aligned
 
-                return " ".join([orig_words[i] for i in extraction_indices])
+            # shift if necessary
+            shift = first_orig_index - first_parse_index
+            extraction_indices = [i+shift for i in extraction_indices]
 
+            if len(orig_words) > extraction_indices[-1]:
+                # extend to the end of the sentence if we're not already there
+                extraction_indices += range(extraction_indices[-1]+1, len(orig_words))
             else:
-                # or maybe the first and/or last words have been transformed,
-                # in which case T-T
-                return None
+                extraction_indices = [i for i in extraction_indices if i<len(orig_words)]
+
+            return " ".join([orig_words[i] for i in extraction_indices])
+
+        # or maybe the first and/or last words have been transformed,
+        # in which case the alignment may still place them
+        return self.realign(first_parse_index, last_parse_index)
+
+
+def extract_subphrase(orig_words, parsed_words, extraction_indices, lang="en"):
+    """
+    try to re-align and extract the correct words given the
+    extraction_indices (which are 1-indexed into parsed_words)
+    """
+    return TokenAlignment(orig_words, parsed_words, lang).extract(extraction_indices)
         
 
 
@@ -226,69 +294,211 @@ def extract_subphrase(orig_words, parsed_words, extraction_indices, lang="en"):
 use corenlp server (see https://github.com/erindb/corenlp-ec2-startup)
 to parse sentences: tokens, dependency parse
 """
-def get_parse(sentence, lang="en", depparse=True):
-    if lang == 'en':
-        sentence = sentence.replace("'t ", " 't ")
-        port = EN_PORT
-    elif lang == "ch":
-        port = CH_PORT
-    elif lang == "sp" or lang=="es":
-        port = SP_PORT
-
+def get_annotators(depparse=True):
     if depparse:
-        url = "http://localhost:" + str(port) + "?properties={annotators:'tokenize,ssplit,pos,depparse'}"
+        return 'tokenize,ssplit,pos,depparse'
     else:
-        url = "http://localhost:" + str(port) + "?properties={annotators:'tokenize,ssplit,pos'}"
+        return 'tokenize,ssplit,pos'
+
+def get_corenlp_query(depparse=True, batched=False):
+    properties = "annotators:'" + get_annotators(depparse) + "'"
+    if batched:
+        # a blank line is always a sentence break (this is also the server default),
+        # which is what lets request_parses put several sentences into one request
+        properties += ",ssplit.newlineIsSentenceBreak:'two'"
 
-    data = sentence
+    return "?properties={" + properties + "}"
 
-    parse_string = requests.post(url, data=data).text
-  
+def prepare_parse_input(sentence, lang="en"):
+    if lang == 'en':
+        sentence = sentence.replace("'t ", " 't ")
+    return sentence
+
+def load_parse_json(parse_string, lang="en", strict=False):
+    """
+    :return: the list of corenlp sentences in the server response,
+             None if the response can't be read
+    """
     parse_string = parse_string.replace('\r\n', '')
     parse_string = parse_string.replace('\x19', '')
 
     try:
-      parsed_output = json.loads(parse_string)
-      sentences = parsed_output["sentences"]
-      if len(sentences)>0:
-        return sentences[0]
-      else:
-        print "error in parse:"
-        print sentences
-        return None
-
+        return json.loads(parse_string)["sentences"]
     except ValueError:
+        if strict:
+            return None
         try:
           if lang=="en":
-            return json.loads(re.sub("[^A-z0-9.,!:?\"'*&/\{\}\[\]()=+-]", "", parse_string))["sentences"][0]
+            return json.loads(re.sub("[^A-z0-9.,!:?\"'*&/\{\}\[\]()=+-]", "", parse_string))["sentences"]
           elif lang=="sp":
-            return json.loads(re.sub("[^áéíóúñÑü¿?¡!ÁÉÍÓÚÜªºA-z0-9.,:\"'*&/\{\}\[\]()=+-]", "", parse_string))["sentences"][0]
+            return json.loads(re.sub("[^áéíóúñÑü¿?¡!ÁÉÍÓÚÜªºA-z0-9.,:\"'*&/\{\}\[\]()=+-]", "", parse_string))["sentences"]
         except:
-          print "error loading json:"
-          print sentence
           return None
 
+def get_parse(sentence, lang="en", depparse=True):
+    return get_parses([sentence], lang=lang, depparse=depparse)[0]
+
+def request_parse(sentence, lang="en", depparse=True):
+    query = get_corenlp_query(depparse)
+    data = prepare_parse_input(sentence, lang)
+
+    parse_string = corenlp_client.post(lang, query, data=data).text
+
+    sentences = load_parse_json(parse_string, lang)
+    if sentences is None:
+        print "error loading json:"
+        print sentence
+        return None
+    elif len(sentences)>0:
+        return ParseRecord.from_json(sentences[0])
+    else:
+        print "error in parse:"
+        print sentences
+        return None
+
+# a one-token paragraph placed between the sentences of a batched request
+PARSE_SENTINEL = "DISEXTRACTSENTINEL"
+
+def is_sentinel(parsed_sentence):
+    tokens = parsed_sentence["tokens"]
+    return len(tokens) == 1 and tokens[0]["word"] == PARSE_SENTINEL
+
+_parse_cache = None
+
+def set_parse_cache(path):
+    """
+    Keep dependency parses in an on-disk cache at path (None to turn caching off)
+    """
+    global _parse_cache
+    if _parse_cache is not None:
+        _parse_cache.close()
+    _parse_cache = ParseCache(path) if path else None
+
+def get_parses(sentences, lang="en", depparse=True):
+    """
+    Parse sentences, going to the parse cache first (see set_parse_cache)
+    and to the corenlp server only for the ones it doesn't have.
+
+    :return: list aligned with sentences, a ParseRecord or None for each of them
+    """
+    if _parse_cache is None:
+        return request_parses(sentences, lang=lang, depparse=depparse)
+
+    annotators = get_annotators(depparse)
+    keys = [parse_key(prepare_parse_input(s, lang), lang, annotators) for s in sentences]
+    cached = _parse_cache.get_many(keys)
+    parses = [cached.get(key) for key in keys]
+
+    missing = [i for i, key in enumerate(keys) if key not in cached]
+    if len(missing) > 0:
+        new_parses = request_parses([sentences[i] for i in missing], lang=lang, depparse=depparse)
+        for i, parse in izip(missing, new_parses):
+            parses[i] = parse
+        # failed parses are not cached, they get another chance next time
+        _parse_cache.put_many([(keys[i], parses[i]) for i in missing if parses[i] is not None])
+
+    return parses
+
+def request_parses(sentences, lang="en", depparse=True):
+    """
+    Parse many sentences with a single request to the corenlp server.
+    Sentences are separated by a sentinel paragraph; every corenlp sentence
+    between two sentinels belongs to the same input sentence and, like get_parse,
+    we keep the first of them.
+
+    :return: list aligned with sentences, a ParseRecord or None for each of them
+    """
+    if len(sentences) == 0:
+        return []
+    if len(sentences) == 1:
+        return [request_parse(sentences[0], lang=lang, depparse=depparse)]
+
+    query = get_corenlp_query(depparse, batched=True)
+    separator = "\n\n" + PARSE_SENTINEL + "\n\n"
+    data = separator.join([prepare_parse_input(s, lang) for s in sentences])
+
+    parse_string = corenlp_client.post(lang, query, data=data).text
+
+    parsed_sentences = load_parse_json(parse_string, lang, strict=True)
+    if parsed_sentences is not None:
+        groups = [[]]
+        for parsed_sentence in parsed_sentences:
+            if is_sentinel(parsed_sentence):
+                groups.append([])
+            else:
+                groups[-1].append(parsed_sentence)
+
+        if len(groups) == len(sentences):
+            return [ParseRecord.from_json(group[0]) if len(group) > 0 else None for group in groups]
+
+    # the response could not be read, or the tokenizer swallowed a sentinel:
+    # parse one at a time, so that a bad sentence only costs itself
+    logger.info("batched parse failed, falling back to single sentences")
+    return [request_parse(s, lang=lang, depparse=depparse) for s in sentences]
+
 
 class Sentence():
-    def __init__(self, json_sentence, original_sentence, lang):
-        self.json = json_sentence
-        self.dependencies = json_sentence["basicDependencies"]
-        self.tokens = json_sentence["tokens"]
+    def __init__(self, parse, original_sentence, lang):
+        """
+        :param parse: a ParseRecord, or a sentence from the corenlp json output
+        """
+        if not isinstance(parse, ParseRecord):
+            parse = ParseRecord.from_json(parse)
+        self.parse = parse
         self.original_sentence = original_sentence
         self.lang = lang
+        self._alignment = None
+        self.build_indexes()
+
+    def alignment(self):
+        """
+        The TokenAlignment of the original sentence and the parse, built on first use
+        and shared by every phrase taken from this sentence
+        """
+        if self._alignment is None:
+            # phrases are read off the parsed words (lang="sp" in extract_subphrase)
+            self._alignment = TokenAlignment(self.original_sentence.split(), self.parse.word_list(), lang="sp")
+        return self._alignment
+
+    def build_indexes(self):
+        """
+        Index the dependencies once, so that the queries made over and over by find_pair
+        only look at the dependencies of one token instead of scanning all of them.
+        Dependencies are stored as positions in the parse record, in corenlp order.
+        """
+        parse = self.parse
+
+        # governor -> dependencies, dependent -> dependencies
+        self.child_deps = {}
+        self.parent_deps = {}
+        # the same, keyed by relation id as well
+        self.child_deps_by_relation = {}
+        self.parent_deps_by_relation = {}
+        for d in range(len(parse.relations)):
+            governor = parse.governors[d]
+            dependent = parse.dependents[d]
+            relation = parse.relations[d]
+            self.child_deps.setdefault(governor, []).append(d)
+            self.parent_deps.setdefault(dependent, []).append(d)
+            self.child_deps_by_relation.setdefault(governor, {}).setdefault(relation, []).append(d)
+            self.parent_deps_by_relation.setdefault(dependent, {}).setdefault(relation, []).append(d)
+
+        # lowercased unicode word -> token indices, looked up with the unicode pattern heads
+        self.word_indices = {}
+        for i, word in enumerate(parse.word_list()):
+            self.word_indices.setdefault(to_unicode(word).lower(), []).append(i+1)
+
     def indices(self, word):
         if len(word.split(" ")) > 1:
             words = word.split(" ")
             indices = [i for lst in [self.indices(w) for w in words] for i in lst]
             return indices
         else:
-            # print " ".join([t["word"].lower() for t in self.tokens])
-            # print word.lower()
-            return [i+1 for i in get_indices([t["word"].lower() for t in self.tokens], word)]
-    def token(self, index):
-        return self.tokens[int(index)-1]
+            return list(self.word_indices.get(word, []))
     def word(self, index):
-        return self.token(index)["word"]
+        return self.parse.word(int(index))
+    def pos(self, index):
+        return self.parse.pos_tag(int(index))
 
     def find_parents(self, index, filter_types=False, needs_verb=False):
         deps = self.find_deps(index, dir="parents", filter_types=filter_types)
@@ -296,7 +506,7 @@ class Sentence():
         if needs_verb:
             deps = [d for d in deps if self.gov_is_verb(d)]
 
-        return [d["governor"] for d in deps]
+        return [self.parse.governors[d] for d in deps]
 
     def find_children(self, index, filter_types=False, exclude_types=False, needs_verb=False, exclude_type_and_POS=False):
         deps = self.find_deps(
@@ -310,16 +520,15 @@ class Sentence():
         if needs_verb:
             deps = [d for d in deps if self.dep_is_verb(d)]
 
-        # print(deps)
-        return [d["dependent"] for d in deps]
+        return [self.parse.dependents[d] for d in deps]
 
     def is_punct(self, index):
-        pos = self.token(index)["pos"]
+        pos = self.pos(index)
         # return pos in '.,"-RRB--LRB-:;'
         return pos in PUNCTUATION
 
     def is_verb(self, index):
-        pos = self.token(index)["pos"]
+        pos = self.pos(index)
         if pos[0] == "V":
             return True
         else:
@@ -331,77 +540,93 @@ class Sentence():
                 return False
 
     def gov_is_verb(self, d):
-        index = d["governor"]
+        index = self.parse.governors[d]
         return self.is_verb(index)
 
     def dep_is_verb(self, d):
-        index = d["dependent"]
+        index = self.parse.dependents[d]
         return self.is_verb(index)
 
     def find_deps(self, index, dir=None, filter_types=False, exclude_types=False, exclude_type_and_POS=False):
+        """
+        :return: dependencies, as positions in the parse record arrays
+        """
+        parse = self.parse
         deps = []
         if dir=="parents" or dir==None:
-            deps += [{"dep": d, "index": d['governor']} for d in self.dependencies if d['dependent']==index]
+            deps += [(d, parse.governors[d]) for d in
+                     self.select_deps(index, self.parent_deps, self.parent_deps_by_relation, filter_types)]
         if dir=="children" or dir==None:
-            deps += [{"dep": d, "index": d['dependent']} for d in self.dependencies if d['governor']==index]
+            deps += [(d, parse.dependents[d]) for d in
+                     self.select_deps(index, self.child_deps, self.child_deps_by_relation, filter_types)]
 
-        if filter_types:
-            deps = [d for d in deps if d["dep"]["dep"] in filter_types]
         if exclude_types:
-            deps = [d for d in deps if not d["dep"]["dep"] in exclude_types]
+            deps = [(d, i) for d, i in deps if not parse.relation(d) in exclude_types]
 
         if exclude_type_and_POS:
-            deps = [d for d in deps if (d["dep"]["dep"], self.token(d["index"])["pos"]) not in exclude_type_and_POS]
+            deps = [(d, i) for d, i in deps if (parse.relation(d), self.pos(i)) not in exclude_type_and_POS]
+
+        return [d for d, _ in deps]
 
-        return [d["dep"] for d in deps]
+    def select_deps(self, index, deps, deps_by_relation, filter_types):
+        if not filter_types:
+            return deps.get(index, [])
+        elif isinstance(filter_types, basestring):
+            # `in` a string is a substring test, keep it that way
+            return [d for d in deps.get(index, []) if self.parse.relation(d) in filter_types]
+        else:
+            by_relation = deps_by_relation.get(index, {})
+            relations = [RELATIONS.ids.get(relation) for relation in set(filter_types)]
+            if len(relations) == 1:
+                return by_relation.get(relations[0], [])
+            return sorted(d for relation in relations for d in by_relation.get(relation, []))
 
     def find_dep_types(self, index, dir=None, filter_types=False):
         deps = self.find_deps(index, dir=dir, filter_types=filter_types)
-        return [d["dep"] for d in deps]
+        return [self.parse.relation(d) for d in deps]
 
     def __str__(self):
         if self.lang == "ch":
-            return "".join([t["word"] for t in self.tokens])
+            return "".join(self.parse.word_list())
         else:
-            return " ".join([t["word"] for t in self.tokens])
-
-    def get_subordinate_indices(self, acc, explore, depth=0, exclude_indices=[], exclude_types=[]):
-        # print("acc: {}\nexplore: {}\ndepth: {}\nexclude_indices: {}".format(acc, explore, depth, exclude_indices))
-        exclude_indices.sort()
-        acc.sort()
-        explore.sort()
-        
-	if depth > 15:
-		return None
-	# print("exclude: " + " ".join([self.tokens[t_ind-1]["word"] for t_ind in exclude_indices]))
-        # print("acc: " + " ".join([self.tokens[t_ind-1]["word"] for t_ind in acc]))
-        # print("explore: " + " ".join([self.tokens[t_ind-1]["word"] for t_ind in explore]))
-        # print("*****")
-
-        if depth==0:
-            all_children = [c for i in explore for c in self.find_children(i, exclude_types=exclude_types, exclude_type_and_POS=top_level_deps_to_ignore_if_extra)]
-        else:
-            all_children = [c for i in explore for c in self.find_children(i, exclude_types=exclude_types)]
+            return " ".join(self.parse.word_list())
+
+    def get_subordinate_indices(self, acc, explore, depth=0, exclude_indices=(), exclude_types=()):
+        """
+        Walk down the dependency tree from explore one level at a time, collecting children
+        that aren't excluded (nor commas right next to an excluded index)
+
+        :return: sorted indices of acc and everything below explore, None if the tree goes deeper than 15 levels
+        """
+        # excluded[i] is 1 if token i is excluded, with room for i+1 past the last token
+        size = max([len(self.parse)] + [i for i in exclude_indices]) + 2
+        excluded = bytearray(size)
+        for i in exclude_indices:
+            if i >= 0:
+                excluded[i] = 1
+
+        acc = list(acc)
+        while depth <= 15:
+            if depth==0:
+                all_children = [c for i in explore for c in self.find_children(i, exclude_types=exclude_types, exclude_type_and_POS=top_level_deps_to_ignore_if_extra)]
+            else:
+                all_children = [c for i in explore for c in self.find_children(i, exclude_types=exclude_types)]
 
-        # exclude indices
-        children = [c for c in all_children if not c in exclude_indices]
+            # exclude indices, and commas before or after excluded indices
+            children = [
+                c for c in all_children
+                if not excluded[c] and not ((excluded[c+1] or excluded[c-1]) and self.word(c)==",")
+            ]
 
-        # delete commas before excluded indices
-        children = [c for c in children if not (c+1 in exclude_indices and self.word(c)==",")]
+            if len(children)==0:
+                acc.sort()
+                return acc
 
-        # delete commas after excluded indices
-        children = [c for c in children if not (c-1 in exclude_indices and self.word(c)==",")]
+            acc += children
+            explore = children
+            depth += 1
 
-        if len(children)==0:
-            return acc
-        else:
-            return self.get_subordinate_indices(
-                acc=acc + children,
-                explore=children,
-                depth=depth+1,
-                exclude_indices=exclude_indices,
-                exclude_types=exclude_types
-            )
+        return None
 
     def get_phrase_from_head(self, head_index, exclude_indices=[], exclude_types=[]):
 
@@ -444,8 +669,6 @@ class Sentence():
 
             # correct subordinate phrase from parsed version to wikitext version
             # (tokenization systems are different)
-            orig_words = self.original_sentence.split()
-            parsed_words = [t["word"] for t in self.tokens]
             #print subordinate_indices
 
             # if "estudios" in parse_subordinate_string:
@@ -460,7 +683,7 @@ class Sentence():
             #         except:
             #             print parsed_words[i]
 
-            subordinate_phrase = extract_subphrase(orig_words, parsed_words, subordinate_indices, lang="sp")
+            subordinate_phrase = self.alignment().extract(subordinate_indices)
 
         # if "ONU" in subordinate_phrase:
         #     print subordinate_phrase
@@ -472,35 +695,30 @@ class Sentence():
             return None
 
     def get_valid_marker_indices(self, marker, dep_pattern):
-        pos = dep_pattern["POS"]
-        if "head" in dep_pattern:
-            marker_head = dep_pattern["head"]
-        else:
-            marker_head = marker
-
-        valid_marker_indices = [i for i in self.indices(marker_head) if self.token(i)["pos"] in pos ]
-        # if marker=="so":
-        #     for i in valid_marker_indices:
-        #         print self.find_children(i)
-        valid_marker_indices = [i for i in valid_marker_indices if len(self.find_children(i))==(len(marker.split(" "))-1)]
-        return valid_marker_indices
+        """
+        :param dep_pattern: DependencyPattern
+        """
+        pos_tags = dep_pattern.pos_tags
+        n_children = dep_pattern.n_marker_words - 1
+        return [
+            i for i in self.indices(dep_pattern.head)
+            if self.pos(i) in pos_tags and len(self.child_deps.get(i, ()))==n_children
+        ]
 
     def get_candidate_S2_indices(self, marker, marker_index, dep_pattern, needs_verb=False):
-        connection_types = [dep_pattern["S2"]]
         # Look for S2
-        return self.find_parents(marker_index, filter_types=connection_types, needs_verb=needs_verb)
+        deps = self.parent_deps_by_relation.get(marker_index, {}).get(dep_pattern.s2_relation, [])
+        if needs_verb:
+            deps = [d for d in deps if self.gov_is_verb(d)]
+        return [self.parse.governors[d] for d in deps]
 
     def get_candidate_S1_indices(self, marker, s2_head_index, dep_pattern, needs_verb=False):
-        valid_connection_types = [dep_pattern["S1"]]
-        return self.find_parents(
-            s2_head_index,
-            filter_types=valid_connection_types,
-            needs_verb=needs_verb
-        ) + self.find_children(
-            s2_head_index,
-            filter_types=valid_connection_types,
-            needs_verb=needs_verb
-        )
+        parent_deps = self.parent_deps_by_relation.get(s2_head_index, {}).get(dep_pattern.s1_relation, [])
+        child_deps = self.child_deps_by_relation.get(s2_head_index, {}).get(dep_pattern.s1_relation, [])
+        if needs_verb:
+            parent_deps = [d for d in parent_deps if self.gov_is_verb(d)]
+            child_deps = [d for d in child_deps if self.dep_is_verb(d)]
+        return [self.parse.governors[d] for d in parent_deps] + [self.parse.dependents[d] for d in child_deps]
 
     def find_pair(self, marker, order, previous_sentence, lang="en"):
         assert(order in ["s2 discourse_marker s1", "any"])
@@ -519,15 +737,15 @@ class Sentence():
         else:
             needs_verb = False
 
-        # if " ".join([t["word"] for t in self.tokens])=="The government buried many in mass graves , some above-ground tombs were forced open so bodies could be stacked inside , and others were burned .":
-        #     print " ".join([t["word"] for t in self.tokens])
+        # if str(self)=="The government buried many in mass graves , some above-ground tombs were forced open so bodies could be stacked inside , and others were burned .":
+        #     print str(self)
         #     print self.get_valid_marker_indices(marker)
 
-        for dep_pattern in dependency_patterns[lang][marker]:
+        for dep_pattern in compiled_dependency_patterns[lang].get(marker, ()):
             #print dep_pattern
             for marker_index in self.get_valid_marker_indices(marker, dep_pattern):
                 #print marker_index
-                # if " ".join([t["word"] for t in self.tokens])=="The government buried many in mass graves , some above-ground tombs were forced open so bodies could be stacked inside , and others were burned .":
+                # if str(self)=="The government buried many in mass graves , some above-ground tombs were forced open so bodies could be stacked inside , and others were burned .":
                 #     print marker_index
 
                 # if marker=="and" and "magical" in str(self):
@@ -543,9 +761,8 @@ class Sentence():
 
                     s1_candidates = self.get_candidate_S1_indices(marker, s2_head_index, dep_pattern, needs_verb=needs_verb)
                     
-                    if "acceptable_order" in dep_pattern:
-                        if dep_pattern["acceptable_order"]=="S1 S2":
-                            s1_candidates = [s1_ind for s1_ind in s1_candidates if s1_ind < s2_ind]
+                    if dep_pattern.s1_before_s2:
+                        s1_candidates = [s1_ind for s1_ind in s1_candidates if s1_ind < s2_ind]
                             
                     
                     for s1_head_index in s1_candidates:
@@ -602,14 +819,14 @@ class Sentence():
             # if S2 is the whole sentence *and* we're missing S1, let S1 be the previous sentence
             words_in_marker = marker.split()
             if S2 and not S1:
-                words_in_sentence = [t["word"] for t in self.tokens if not self.is_punct(t["index"])]
+                words_in_sentence = [self.word(i) for i in range(1, len(self.parse)+1) if not self.is_punct(i)]
                 words_in_s2 = [t for t in S2.split() if not t in PUNCTUATION]
                 if len(words_in_sentence) - len(words_in_marker) == len(words_in_s2):
                     S1 = previous_sentence[0].capitalize() + previous_sentence[1:]
             else:
                 # if we don't choose S1 to be the previous sentence, then
                 # we might have to switch S1 and S2 because of the way the cc conj pattern works
-                if S1 and S2 and "flip" in dep_pattern and dep_pattern["flip"]:
+                if S1 and S2 and dep_pattern.flip:
                     return S2, S1
 
             if S1 and S2:
@@ -617,11 +834,40 @@ class Sentence():
 
         return None
 
-def setup_corenlp(lang="en"):
-    try:
-        test_sentences = {"en": "The quick brown fox jumped over the lazy dog.", "ch": "当周二开始申购时,有数万人涌入索取MTRC的申请表,可以说是盛况空前。", "sp": "Que voy a hacer?"}
-        get_parse(test_sentences[lang], lang=lang)
-    except:
+    def find_pairs(self, markers, order, previous_sentence, lang="en"):
+        """
+        find_pair for several markers at once. One pass over the words picks the markers
+        whose head word is in the sentence, the others can't match and are skipped,
+        as are markers with no dependency pattern (the Spanish "por eso").
+
+        :return: dict of marker -> (S1, S2), for the markers that matched
+        """
+        heads = marker_heads[lang]
+        present = set(m for word in self.word_indices for m in heads.get(word, ()))
+        pairs = {}
+        for marker in markers:
+            patterns = compiled_dependency_patterns[lang].get(marker, ())
+            # heads with a space are looked up word by word, leave those to find_pair
+            if marker in present or any(" " in p.head for p in patterns):
+                pair = self.find_pair(marker, order, previous_sentence, lang=lang)
+                if pair:
+                    pairs[marker] = pair
+        return pairs
+
+def setup_corenlp(lang="en", pool_size=None, endpoints=None, balance=CORENLP_BALANCE):
+    """
+    :param endpoints: urls of the corenlp servers for this language, CORENLP_ENDPOINTS by default
+    :param balance: round_robin|least_outstanding
+    """
+    if pool_size is not None:
+        corenlp_client.set_pool_size(pool_size)
+    if endpoints:
+        corenlp_client.set_endpoints(lang, endpoints, balance=balance)
+
+    test_sentences = {"en": "The quick brown fox jumped over the lazy dog.", "ch": "当周二开始申购时,有数万人涌入索取MTRC的申请表,可以说是盛况空前。", "sp": "Que voy a hacer?"}
+    endpoint_pool = corenlp_client.get_endpoint_pool(lang)
+    down = endpoint_pool.check(get_corenlp_query(), test_sentences[corenlp_client.normalize_lang(lang)])
+    if len(down) == len(endpoint_pool.endpoints):
         # TODO
         # run the server if we can
         # otherwise ask to install the server and install it if we can
@@ -638,28 +884,69 @@ def setup_corenlp(lang="en"):
 
 def depparse_ssplit(sentence, previous_sentence, marker, lang="en"):
     # print sentence
-    orig_sentence = sentence.encode("utf-8")
     sentence = sentence.strip()
     previous_sentence = previous_sentence.strip()
     sentence = cleanup(sentence, lang)
 
     parse = get_parse(sentence.encode("utf-8"), lang=lang)
+    return split_from_parse(parse, sentence, previous_sentence, marker, lang=lang)
+
+def depparse_ssplit_batch(items, lang="en"):
+    """
+    Same as depparse_ssplit, but all sentences go to the corenlp server in one request
+
+    :param items: list of (sentence, previous_sentence, marker)
+    :return: list aligned with items, a (s1, s2) pair or None for each of them
+    """
+    sentences = cleanup_batch([sentence for sentence, _, _ in items], lang)
+    parses = get_parses([sentence.encode("utf-8") for sentence in sentences], lang=lang)
+
+    pairs = []
+    for (_, previous_sentence, marker), sentence, parse in izip(items, sentences, parses):
+        pairs.append(split_from_parse(parse, sentence, previous_sentence.strip(), marker, lang=lang))
+    return pairs
+
+def depparse_ssplit_markers(sentence, previous_sentence, markers, lang="en"):
+    """
+    Same as depparse_ssplit, for all the markers the sentence was filed under
+
+    :return: list of (s1, s2, marker)
+    """
+    sentence = cleanup(sentence.strip(), lang)
+    parse = get_parse(sentence.encode("utf-8"), lang=lang)
+    return split_from_parse_markers(parse, sentence, previous_sentence.strip(), markers, lang=lang)
+
+def depparse_ssplit_markers_batch(items, lang="en"):
+    """
+    Same as depparse_ssplit_markers, but all sentences go to the corenlp server in one request
+
+    :param items: list of (sentence, previous_sentence, markers)
+    :return: list aligned with items, a list of (s1, s2, marker) for each of them
+    """
+    sentences = cleanup_batch([sentence for sentence, _, _ in items], lang)
+    parses = get_parses([sentence.encode("utf-8") for sentence in sentences], lang=lang)
+
+    splits = []
+    for (_, previous_sentence, markers), sentence, parse in izip(items, sentences, parses):
+        splits.append(split_from_parse_markers(parse, sentence, previous_sentence.strip(), markers, lang=lang))
+    return splits
+
+def split_from_parse_markers(parse, sentence, previous_sentence, markers, lang="en"):
+    if parse:
+        pairs = Sentence(parse, sentence, lang).find_pairs(markers, "any", previous_sentence, lang=lang)
+        return [(pairs[marker][0], pairs[marker][1], marker) for marker in markers if marker in pairs]
+    else:
+        return []
+
+def split_from_parse(parse, sentence, previous_sentence, marker, lang="en"):
     if parse:
         # if "ONU" in str(sentence):
         #     pp.pprint(parse["tokens"])
         #     # pp.pprint(parse["basicDependencies"])
         #     # print(json.dumps(parse["tokens"], indent=4))
         sentence = Sentence(parse, sentence, lang)
-        #print sentence
-        # print orig_sentence
-        # print len(orig_sentence)
-        # print str(sentence)
-        # print len(str(sentence))
 
-        # print sentence
         pair = sentence.find_pair(marker, "any", previous_sentence, lang=lang)
-        #print pair
-        #stop
         return pair
     else:
         return None
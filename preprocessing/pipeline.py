@@ -0,0 +1,304 @@
+# -*- coding: utf-8 -*-
+
+"""
+The stages every corpus goes through, and the command line that runs them
+
+A corpus plugs in with a CorpusReader subclass, which says where its files are
+and how a line of them turns into sentences with markers; everything else,
+sharded filtering, batched concurrent parsing, the parse cache and checkpoints,
+is shared. A corpus driver is then just
+
+    class MyCorpusReader(CorpusReader):
+        ...
+
+    if __name__ == '__main__':
+        main(MyCorpusReader)
+
+Nothing happens at import time: the command line and the json config
+are only read by main.
+"""
+
+import os
+import sys
+import json
+import logging
+import argparse
+from collections import defaultdict
+from os.path import join as pjoin
+
+from util import rephrase, MarkerScanner, SeenSet
+from parser import depparse_ssplit_markers, depparse_ssplit_markers_batch, setup_corenlp, set_parse_cache
+from parse_driver import run_parse_stage
+from sharding import filter_files
+from length_filter import LengthFilter
+from cfg import PARSE_BATCH_SIZE, PARSE_CONCURRENCY, PARSE_CHECKPOINT_EVERY, CORENLP_BALANCE
+from cfg import DISCOURSE_MARKER_SET_TAG, EN_DISCOURSE_MARKERS, EN_FIVE_DISCOURSE_MARKERS, EN_EIGHT_DISCOURSE_MARKERS
+
+logger = logging.getLogger(__name__)
+
+
+class CorpusReader(object):
+    """
+    Turns the lines of a corpus into a stream of sentences, and says which markers a sentence has.
+    The default is a file with one sentence per line, filtered on length and matched word by word.
+
+    Readers are sent to the filter worker processes, so they must pickle.
+    """
+    description = None
+    # key of the corpus directory in the json config
+    config_key = None
+    # files of that directory the filter stage reads
+    files = []
+    marker_set_tag = DISCOURSE_MARKER_SET_TAG
+    markers = EN_DISCOURSE_MARKERS
+    lang = "en"
+    # the filter stage appends to its output instead of replacing it
+    append_filtered = False
+    stages = ("filter", "parse")
+
+    def __init__(self, source_dir, args):
+        self.source_dir = source_dir
+        self.min_seq_len = args.min_seq_len
+        self.max_seq_len = args.max_seq_len
+        self.print_every = args.filter_print_every
+        # [min_len, max_len) like [5, 10)
+        self.length_filter = LengthFilter(self.min_seq_len, self.max_seq_len, closed="left")
+        self.scanner = MarkerScanner(self.markers)
+
+    def sentences(self, line):
+        """
+        :return: the sentences of a line of the corpus, in order
+        """
+        return [line]
+
+    def find_markers(self, sentence):
+        """
+        :return: the markers the sentence is kept for, none if it is filtered out
+        """
+        words = rephrase(sentence).split()  # replace "for example"
+
+        if not self.length_filter.keep_lengths(len(words)):
+            return []
+        return self.scanner.scan(words)
+
+    def filter_lines(self, lines, previous_sentence, writer):
+        """
+        Filter a run of consecutive lines of the corpus
+
+        :param previous_sentence: the last sentence before these lines
+        :return: the last sentence
+        """
+        for i, line in enumerate(lines):
+            for sentence in self.sentences(line):
+                markers = self.find_markers(sentence)
+                if len(markers) > 0:
+                    writer.write(sentence, previous_sentence, markers)
+                previous_sentence = sentence
+
+            if i % self.print_every == 0:
+                logger.info("processed {}".format(i))
+
+        return previous_sentence
+
+    def extract(self, processes=1):
+        """
+        Stage 1 of the corpora that need it: build the files the filter stage reads
+        """
+        raise NotImplementedError
+
+
+def collect_raw_sentences(reader, processes=1):
+    markers_dir = pjoin(reader.source_dir, "markers_" + reader.marker_set_tag)
+    output_dir = pjoin(markers_dir, "sentences")
+
+    if not os.path.exists(markers_dir):
+        os.makedirs(markers_dir)
+    if not os.path.exists(output_dir):
+        os.makedirs(output_dir)
+
+    writer = filter_files([pjoin(reader.source_dir, filename) for filename in reader.files],
+                          pjoin(output_dir, "{}.jsonl".format(reader.marker_set_tag)),
+                          reader, processes=processes, mode='ab' if reader.append_filtered else 'wb')
+    logger.info('file writing complete')
+
+    statistics_report = writer.statistics_report()
+    with open(pjoin(markers_dir, "VERSION.txt"), "wb") as f:
+        f.write(
+            "commit: \n\ncommand: \n\nmarkers:\n" + statistics_report
+        )
+
+
+# what a sentence the parser or the patterns choke on raises: bad json, a parse
+# the patterns don't expect... A server that can't be reached (requests.ConnectionError,
+# requests.Timeout) is not one of them: that stops the run before the checkpoint
+# moves past the sentences, so that they are parsed when the run is resumed.
+SENTENCE_ERRORS = (ValueError, KeyError, IndexError)
+
+
+def dependency_parsing(sentence, previous_sentence, markers, lang="en"):
+    try:
+        return depparse_ssplit_markers(sentence, previous_sentence, markers, lang=lang)
+    except SENTENCE_ERRORS:
+        logger.warning(u"could not parse for {}: {}".format(" ".join(markers), sentence))
+        return []
+
+
+def dependency_parsing_batch(items, lang="en"):
+    try:
+        return depparse_ssplit_markers_batch(items, lang=lang)
+    except SENTENCE_ERRORS:
+        # one sentence broke the block, don't let it take the others down with it
+        return [dependency_parsing(sentence, previous, markers, lang) for sentence, previous, markers in items]
+
+
+def parse_filtered_sentences(reader, args):
+    markers_dir = pjoin(reader.source_dir, "markers_" + reader.marker_set_tag)
+    input_dir = pjoin(markers_dir, "sentences")
+    input_file_path = pjoin(input_dir, "{}.jsonl".format(reader.marker_set_tag))
+    output_dir = pjoin(markers_dir, "parsed_sentence_pairs")
+
+    if not os.path.exists(markers_dir):
+        raise Exception("{} does not exist".format(markers_dir))
+    if not os.path.exists(input_dir):
+        raise Exception("{} does not exist".format(input_dir))
+    if not os.path.exists(input_file_path):
+        raise Exception("{} does not exist".format(input_file_path))
+
+    if not os.path.exists(output_dir):
+        os.makedirs(output_dir)
+
+    logger.info("setting up parser (actually just testing atm)")
+    setup_corenlp(reader.lang, pool_size=args.parse_concurrency,
+                  endpoints=args.corenlp_endpoints, balance=args.balance)
+
+    if not args.no_dep_cache:
+        # parses don't depend on the marker set, so the cache is shared by the whole corpus
+        set_parse_cache(pjoin(reader.source_dir, "dep_cache.sqlite"))
+
+    logger.info("reading {}".format(input_file_path))
+    # sentences are read as they get parsed, each one once for all of its markers
+    run_parse_stage(input_file_path,
+                    pjoin(output_dir, "{}_parsed_sentence_pairs.txt".format(reader.marker_set_tag)),
+                    lambda items: dependency_parsing_batch(items, reader.lang),
+                    markers=reader.markers, batch_size=args.parse_batch_size,
+                    concurrency=args.parse_concurrency, checkpoint_every=args.checkpoint_every,
+                    restart=args.restart_parse, print_every=args.filter_print_every)
+
+    logger.info('file writing complete')
+
+
+def split_parsed_sentences(source_dir, marker_set_tag, tag):
+    """
+    Stage 3 of the english corpora: group the parsed pairs by the marker sets of cfg.py
+    """
+    markers_dir = pjoin(source_dir, "markers_" + marker_set_tag)
+    output_dir = pjoin(markers_dir, "parsed_sentence_pairs")
+
+    five_sents = []
+    eight_sents = []
+    all_sents = []
+
+    seen = SeenSet()  # we expect repeating entries
+    marker_stats = defaultdict(int)
+
+    with open(pjoin(output_dir, "{}_parsed_sentence_pairs.txt".format(marker_set_tag)), 'r') as f:
+        # this is a tsv file
+        for line in f:
+            if seen.first_time(line):
+                row = line.strip().split('\t')
+                marker_stats[row[2]] += 1
+                all_sents.append(row)
+                if row[2] in EN_FIVE_DISCOURSE_MARKERS:
+                    five_sents.append(row)
+                if row[2] in EN_EIGHT_DISCOURSE_MARKERS:
+                    eight_sents.append(row)
+
+    for k, v in marker_stats.iteritems():
+        print "{}: {}".format(k, v)
+
+    with open(pjoin(output_dir, "stats.txt"), 'w') as f:
+        for k, v in marker_stats.iteritems():
+            f.write("{}: {}\n".format(k, v))
+
+    with open(pjoin(output_dir, tag + "_FIVE_{}".format("_".join(EN_FIVE_DISCOURSE_MARKERS))), 'w') as f:
+        for row in five_sents:
+            f.write("{}\t{}\t{}\n".format(row[0], row[1], row[2]))
+
+    with open(pjoin(output_dir, tag + "_EIGHT_{}".format("_".join(EN_EIGHT_DISCOURSE_MARKERS))), 'w') as f:
+        for row in eight_sents:
+            f.write("{}\t{}\t{}\n".format(row[0], row[1], row[2]))
+
+    with open(pjoin(output_dir, tag + "_ALL_{}".format("_".join(EN_DISCOURSE_MARKERS))), 'w') as f:
+        for row in all_sents:
+            f.write("{}\t{}\t{}\n".format(row[0], row[1], row[2]))
+
+
+def argument_parser(reader_class):
+    parser = argparse.ArgumentParser(description=reader_class.description)
+    stage = dict((name, i + 1) for i, name in enumerate(reader_class.stages))
+
+    parser.add_argument("--json", type=str, default="example_config.json", help="corpus parameter setting to load")
+
+    if "extract" in reader_class.stages:
+        parser.add_argument("--extract", action='store_true',
+                            help="Stage {}: extract the text of the corpus from its raw files".format(stage["extract"]))
+        parser.add_argument("--extract_processes", default=1, type=int,
+                            help="number of processes the extraction runs on, one news source at a time each")
+
+    parser.add_argument("--filter", action='store_true',
+                        help="Stage {}: run filtering on the corpus, collect sentence pairs (sentence and previous sentence)".format(stage["filter"]))
+    parser.add_argument("--max_seq_len", default=50, type=int)
+    parser.add_argument("--min_seq_len", default=5, type=int)
+    parser.add_argument("--filter_print_every", default=10000, type=int)
+    parser.add_argument("--filter_processes", default=1, type=int,
+                        help="number of processes the filter stage runs on, each input file is split in as many shards")
+
+    parser.add_argument("--parse", action='store_true',
+                        help="Stage {}: run parsing on filtered sentences, collect sentence pairs (S1 and S2)".format(stage["parse"]))
+    parser.add_argument("--parse_batch_size", default=PARSE_BATCH_SIZE, type=int,
+                        help="number of sentences sent to the corenlp server in one request")
+    parser.add_argument("--parse_concurrency", default=PARSE_CONCURRENCY, type=int,
+                        help="number of requests kept in flight against the corenlp server")
+    parser.add_argument("--checkpoint_every", default=PARSE_CHECKPOINT_EVERY, type=int,
+                        help="save the progress of the parse stage every this many sentences")
+    parser.add_argument("--restart_parse", action='store_true',
+                        help="parse from the beginning instead of resuming from the last checkpoint")
+    parser.add_argument("--corenlp_endpoints", type=str, default="",
+                        help="comma separated urls of the corenlp servers to spread requests over, CORENLP_ENDPOINTS in cfg.py by default")
+    parser.add_argument("--balance", type=str, default=CORENLP_BALANCE, help="round_robin|least_outstanding")
+    parser.add_argument("--no_dep_cache", action='store_true', help="not caching dependency parsed result")
+
+    if "split" in reader_class.stages:
+        parser.add_argument("--split", action='store_true',
+                            help="Stage {}: load in parsed sentences pairs and split into discourse marker set based groups".format(stage["split"]))
+        parser.add_argument("--tag", type=str, default="discourse_EN", help="the tag of the generated file such as discourse_EN_FIVE_and_but_because_if_when_2017dec12.tsv")
+
+    return parser
+
+
+def main(reader_class, argv=None):
+    """
+    Run the stage asked for on the command line on the corpus of reader_class
+    """
+    args, _ = argument_parser(reader_class).parse_known_args(argv)
+    args.corenlp_endpoints = [url for url in args.corenlp_endpoints.split(",") if url]
+
+    # sentences are mixed str and unicode all the way through
+    reload(sys)
+    sys.setdefaultencoding('utf8')
+
+    logging.basicConfig(format='[%(asctime)s] %(levelname)s: %(message)s',
+                        datefmt='%m/%d/%Y %I:%M:%S %p', level=logging.INFO)
+
+    with open(args.json, 'rb') as f:
+        json_config = json.load(f)
+    reader = reader_class(json_config[reader_class.config_key], args)
+
+    if getattr(args, "extract", False):
+        reader.extract(processes=args.extract_processes)
+    elif args.filter:
+        collect_raw_sentences(reader, processes=args.filter_processes)
+    elif args.parse:
+        parse_filtered_sentences(reader, args)
+    elif getattr(args, "split", False):
+        split_parsed_sentences(reader.source_dir, reader.marker_set_tag, args.tag)
@@ -10,7 +10,13 @@ from itertools import izip
 
 import random
 import numpy as np
-from util import rephrase
+from multiprocessing import Pool
+from util import rephrase, blocks, Reservoir, hash_split
+from sharding import line_shards, read_raw_lines
+from length_filter import LengthFilter
+from external_shuffle import ExternalShuffle
+from segmentation import segment_examples
+from checkpoint import Checkpoint
 from os.path import join as pjoin
 from os.path import dirname, abspath
 
@@ -50,6 +56,8 @@ parser = argparse.ArgumentParser(description='DisExtract Producer')
 parser.add_argument("--corpus", type=str, default='books',
                     help="books|gigaword_ch|gigaword_es, marked by Spanish and Chinese")
 parser.add_argument("--train_size", default=0.9, type=float)
+parser.add_argument("--split_mode", type=str, default="shuffle",
+                    help="shuffle|hash, hash puts each example in a split by a hash of (s1, s2), stable as the corpus grows")
 parser.add_argument("--max_seq_len", default=50, type=int)
 parser.add_argument("--min_seq_len", default=5, type=int)
 parser.add_argument("--max_ratio", default=5.0, type=float)
@@ -62,13 +70,27 @@ parser.add_argument("--balanced", action='store_true', help="use this flag to cu
 parser.add_argument("--count_per_marker", type=int, default=-1,
                     help="use this for modifying the cutoff for a 'balanced' dataset, by default perfectly balanced")
 parser.add_argument("--exclude", type=str, default="")
+parser.add_argument("--filter_processes", type=int, default=1,
+                    help="number of processes the length filtering runs on, each on a shard of the data file")
+parser.add_argument("--shuffle_buckets", type=int, default=64,
+                    help="temporary files the dataset is shuffled through, about 1/shuffle_buckets of it is held in memory")
 parser.add_argument("--stf_seg_path", type=str, default="")
 parser.add_argument("--stf_slf4j_path", type=str, default="")
-parser.add_argument("--char", action='store_true',
-                    default="only used to generate Chinese in char level, no word segmentation")
+parser.add_argument("--seg_batch_size", type=int, default=10000,
+                    help="number of examples segmented in one run of the segmenter")
+parser.add_argument("--seg_processes", type=int, default=1, help="number of segmenters running at once")
+parser.add_argument("--restart_seg", action='store_true',
+                    help="segment from the beginning instead of resuming an interrupted segmentation")
+parser.add_argument("--char", action='store_true', default=True,
+                    help="generate Chinese in char level, no word segmentation (the default)")
+parser.add_argument("--word_seg", dest="char", action='store_false',
+                    help="word segment Chinese with the Stanford segmenter instead, needs --stf_seg_path and --stf_slf4j_path")
 
 args, _ = parser.parse_known_args()
-args.min_ratio = 1 / args.max_ratio  # auto-generate min-ratio
+if args.corpus == "gigaword_ch" and not args.char and (args.stf_seg_path == "" or args.stf_slf4j_path == ""):
+    parser.error("--word_seg needs --stf_seg_path and --stf_slf4j_path")
+# s1 and s2 lengths in [min_seq_len, max_seq_len], their ratio within [1 / max_ratio, max_ratio]
+length_filter = LengthFilter(args.min_seq_len, args.max_seq_len, args.max_ratio, chars=args.corpus == "gigaword_ch")
 
 if args.stf_slf4j_path != "":
     path_to_slf4j = pjoin(args.stf_slf4j_path, 'slf4j-api.jar')
@@ -93,12 +115,6 @@ if args.data_dir == "default":
     args.data_dir = pjoin(root_dir, "data", args.corpus)
 
 
-def write_to_tsv(data, file_name):
-    with open(file_name, 'wb') as f:
-        for line in data:
-            f.write(line)
-
-
 def add_one_to_dict(dic, entry):
     if entry in dic:
         dic[entry] += 1
@@ -112,138 +128,184 @@ def print_dict(dict):
         print "{}: {}".format(key, value)
 
 
-if __name__ == '__main__':
+# lines are length filtered this many at a time
+FILTER_BATCH_SIZE = 10000
+
+
+def prepare_example(line):
+    """
+    :return: (s1, s2, label) of a line of the tsv
+    """
+    s1, s2, label = line[:-1].split('\t')
+
+    if args.corpus == 'gigaword_ch':
+        s1 = s1.replace(' .', '。')  # parser appended normal period
+        s2 = s2.replace(' .', '。')
+
+    if args.char and args.corpus == "gigaword_ch":
+        # we presplit into chars
+        s1 = " ".join(split_unicode_chrs(s1.decode('utf-8'))).encode('utf-8')
+        s2 = " ".join(split_unicode_chrs(s2.decode('utf-8'))).encode('utf-8')
+
+    return s1, s2, label
+
+
+def filter_examples(lines):
+    """
+    :return: (example line, label) of the lines that pass the length and ratio filters, in order
+    """
+    examples = [prepare_example(line) for line in lines]
+    kept = length_filter.filter_pairs([ex[0] for ex in examples], [ex[1] for ex in examples])
+    return [("\t".join(examples[i]) + "\n", examples[i][2]) for i in kept]
+
+
+def filter_shard(job):
+    """
+    :return: the number of lines read
+    """
+    path, start, end, shard_path = job
+    n_lines = 0
+    with open(shard_path, 'wb') as out:
+        for lines in blocks(read_raw_lines(path, start, end), FILTER_BATCH_SIZE):
+            n_lines += len(lines)
+            for example_line, _ in filter_examples(lines):
+                out.write(example_line)
+    return n_lines
+
+
+def read_examples(path, counts, processes=1):
+    """
+    Reads the tsv a block of lines at a time, keeping the examples that pass the length and ratio filters.
+    With several processes, each filters a shard of the file into a file of its own, read back in order.
+
+    :param counts: dict, counts["original"] is incremented by the number of lines read
+    :yields: (example line, label)
+    """
+    if processes <= 1:
+        for lines in blocks(read_raw_lines(path), FILTER_BATCH_SIZE):
+            counts["original"] += len(lines)
+            for example in filter_examples(lines):
+                yield example
+        return
+
+    jobs = [(path, start, end, "{}.shard{}".format(path, k)) for k, (start, end) in enumerate(line_shards(path, processes))]
+    pool = Pool(processes)
+    try:
+        counts["original"] += sum(pool.map(filter_shard, jobs, chunksize=1))
+    finally:
+        pool.close()
+        pool.join()
+
+    for job in jobs:
+        shard_path = job[3]
+        with open(shard_path, 'rb') as f:
+            for example_line in f:
+                yield example_line, example_line[:-1].split('\t')[2]
+        os.remove(shard_path)
+
+
+def write_splits(examples, n_examples):
+    """
+    Writes the train, valid and test files a line at a time
+
+    :param examples: the example lines, in random order
+    :return: dict of split -> number of examples written to it
+    """
+    n_train = int(np.rint(n_examples * split_proportions['train']))
+    n_train_valid = int(np.rint(n_examples * (split_proportions['train'] + split_proportions['valid'])))
+
+    split_counts = {"train": 0, "valid": 0, "test": 0}
+    # Note that under default setting, corpus is already appended
+    split_files = dict((split, open(pjoin(args.data_dir, args.out_prefix + "_{}.tsv".format(split)), 'wb'))
+                       for split in split_counts)
+    for i, ex in enumerate(examples):
+        if args.split_mode == "hash":
+            # the split of an example only depends on its (s1, s2)
+            split = hash_split(split_proportions, *ex.split('\t')[:2])
+        elif i < n_train:
+            split = "train"
+        elif i < n_train_valid:
+            split = "valid"
+        else:
+            split = "test"
+        split_files[split].write(ex)
+        split_counts[split] += 1
+
+    for f in split_files.values():
+        f.close()
+    return split_counts
 
-    examples = []
 
-    with open(pjoin(args.data_dir, args.data_file), 'rb') as f:
-        for line in f:
-            examples.append(line)
+if __name__ == '__main__':
+
+    data_path = pjoin(args.data_dir, args.data_file)
+    exclude_marker_list = args.exclude.split(",")
 
     if args.corpus == "gigaword_ch" and not args.char:
         print "segmenting each example for Chinese, could take a while"
-        from nltk.tokenize.stanford_segmenter import StanfordSegmenter
 
-        seg = StanfordSegmenter(path_to_slf4j=path_to_slf4j, path_to_jar=path_to_jar)
-        seg.default_config('zh')
+    count_per_marker = args.count_per_marker
+    if args.balanced and count_per_marker == -1:
+        # perfectly balanced is the count of the rarest marker,
+        # count them first so that the sampling pass only keeps that many of each
+        data_dist = {}
+        for _, label in read_examples(data_path, {"original": 0}, args.filter_processes):
+            add_one_to_dict(data_dist, label)
+        assert len(data_dist) != 0
+        count_per_marker = min(data_dist.values())
 
     # ==== Filtering =====
+    # the input is streamed, and what goes into the dataset is shuffled on disk:
+    # all of it, or for a balanced dataset a random sample of count_per_marker examples of each marker
+    shuffled = ExternalShuffle(buckets=args.shuffle_buckets, seed=123, tmp_dir=args.data_dir)
+    counts = {"original": 0}
     data_dist = {}
-    filtered_examples = {}
+    reservoirs = {}
     number_of_filtered_examples = 0
-    for i, ex in enumerate(examples):
-        s1, s2, label = ex[:-1].split('\t')
-
-        if args.corpus == 'gigaword_ch':
-            s1 = s1.replace(' .', '。')  # parser appended normal period
-            s2 = s2.replace(' .', '。')
-
-        if args.char and args.corpus == "gigaword_ch":
-            # we presplit into chars
-            s1 = " ".join(split_unicode_chrs(s1.decode('utf-8'))).encode('utf-8')
-            s2 = " ".join(split_unicode_chrs(s2.decode('utf-8'))).encode('utf-8')
-
-        s1_len = len(s1.split()) if args.corpus != "gigaword_ch" else len(s1.decode('utf-8'))
-        s2_len = len(s2.split()) if args.corpus != "gigaword_ch" else len(s2.decode('utf-8'))
-
-        ratio = float(s1_len) / max(s2_len, 0.0001)
-
-        if s1_len < args.min_seq_len or args.max_seq_len < s1_len:
-            continue
-        elif s2_len < args.min_seq_len or args.max_seq_len < s2_len:
-            continue
-        elif ratio < args.min_ratio or args.max_ratio < ratio:
-            continue
-        else:
-            example_line = "\t".join([s1, s2, label]) + "\n"
-            if label in filtered_examples:
-                filtered_examples[label].append(example_line)
+    for example_line, label in read_examples(data_path, counts, args.filter_processes):
+        if label not in exclude_marker_list:
+            if args.balanced:
+                if label not in reservoirs:
+                    reservoirs[label] = Reservoir(count_per_marker)
+                reservoirs[label].add(example_line)
             else:
-                filtered_examples[label] = [example_line]
-            # filtered_examples.append("\t".join([s1, s2, label]))
-            # collect stats
-            add_one_to_dict(data_dist, label)
-            number_of_filtered_examples += 1
+                shuffled.add(example_line)
+        # collect stats
+        add_one_to_dict(data_dist, label)
+        number_of_filtered_examples += 1
 
-    print("original number: {}, filtered out number: {}".format(len(examples), number_of_filtered_examples))
+    print("original number: {}, filtered out number: {}".format(counts["original"], number_of_filtered_examples))
 
     assert number_of_filtered_examples != 0
 
     print("label distribution:")
     print(print_dict(data_dist))
 
-    minimum_count_per_marker = min(data_dist.values())
-
-    exclude_marker_list = args.exclude.split(",")
-
-    examples = []
-    for label in filtered_examples:
-        if label in exclude_marker_list:
-            pass
-        else:
-            if args.balanced:
-                random.shuffle(filtered_examples[label])
-                if args.count_per_marker == -1:
-                    count_per_marker = minimum_count_per_marker
-                else:
-                    count_per_marker = args.count_per_marker
-                examples += filtered_examples[label][:count_per_marker]
-            else:
-                examples += filtered_examples[label]
-
-    print "total number in produced dataset: {}".format(len(examples))
+    for label in reservoirs:
+        for example_line in reservoirs[label].sample():
+            shuffled.add(example_line)
 
+    n_examples = len(shuffled)
+    print "total number in produced dataset: {}".format(n_examples)
     # now we word segment for Chinese
-    if args.corpus == "gigaword_ch" and not args.char:
-        s1_list, s2_list, labels = [], [], []
-        for ex in examples:
-            s1, s2, label = ex.split('\t')
-
-            s1_list.append(s1.decode('utf-8'))
-            s2_list.append(s2.decode('utf-8'))
-            labels.append(label)
-
-        logging.info("s1, s2 collected, segmentation begins")
-        s1_list = seg.segment_sents(s1_list)
-        s1_list = s1_list.split('\n')[:-1]
-        logging.info("s1 segmented")
-
-        s2_list = seg.segment_sents(s2_list)
-        s2_list = s2_list.split('\n')[:-1]
-        logging.info("s2 segmented")
-
-        examples = []
-        assert len(s1_list) == len(s2_list) == len(labels)
-        for i in range(len(s1_list)):
-            example_line = "\t".join([s1_list[i], s2_list[i], labels[i]])  # label has '\n'
-            examples.append(example_line)  # no need to encode in utf-8 anymore, seg produces utf-8
-
-        logging.info("data list generated")
-
-    serial_numbers = range(len(examples))
-    random.shuffle(serial_numbers)
-
-    train_numbers = serial_numbers[:int(np.rint(len(examples) * split_proportions['train']))]
-    valid_numbers = serial_numbers[
-                    int(np.rint(len(examples) * split_proportions['train'])): \
-                        int(np.rint(len(examples) * (split_proportions['train'] + split_proportions['valid'])))]
-    test_numbers = serial_numbers[
-                   int(np.rint(len(examples) * (split_proportions['train'] + split_proportions['valid']))):]
+    segment = args.corpus == "gigaword_ch" and not args.char
+    segmented_path = pjoin(args.data_dir, args.out_prefix + "_segmented.tsv")
+    try:
+        if segment:
+            logging.info("segmentation begins")
+            segment_examples(shuffled, segmented_path, path_to_slf4j, path_to_jar, batch_size=args.seg_batch_size,
+                             processes=args.seg_processes, restart=args.restart_seg)
+            logging.info("examples segmented")
+            with open(segmented_path, 'rb') as examples:
+                split_counts = write_splits(examples, n_examples)
+            os.remove(segmented_path)
+            os.remove(Checkpoint(segmented_path).path)
+        else:
+            split_counts = write_splits(shuffled, n_examples)
+    finally:
+        # the shuffle's temporary files, also when segmentation stops half way
+        shuffled.close()
 
     print(
-        "train/valid/test number of examples: {}/{}/{}".format(len(train_numbers), len(valid_numbers),
-                                                               len(test_numbers)))
-
-    train, valid, test = [], [], []
-
-    for tn in train_numbers:
-        train.append(examples[tn])
-    for tn in valid_numbers:
-        valid.append(examples[tn])
-    for tn in test_numbers:
-        test.append(examples[tn])
-
-    # Note that under default setting, corpus is already appended
-    write_to_tsv(train, pjoin(args.data_dir, args.out_prefix + "_train.tsv"))
-    write_to_tsv(valid, pjoin(args.data_dir, args.out_prefix + "_valid.tsv"))
-    write_to_tsv(test, pjoin(args.data_dir, args.out_prefix + "_test.tsv"))
+        "train/valid/test number of examples: {}/{}/{}".format(split_counts["train"], split_counts["valid"],
+                                                               split_counts["test"]))
@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+
+"""
+Word segmentation of the Chinese examples of producer.py, a batch at a time
+
+Examples are numbered in the order they come, and sent in batches to worker
+processes. A worker sets up an nltk StanfordSegmenter on its first batch and
+reuses it, but nltk starts a new JVM (and loads the model) for every
+segment_sents call, so the s1 and s2 of a batch are segmented in one call and
+the batch size is what makes that start-up cost small. Batches go through
+pool.imap a few at a time: they come back in order, with their numbers, and only
+those few are in memory. The segmented examples are written out as they come,
+with a checkpoint (see checkpoint.py) after every batch, so an interrupted run
+picks up after the last batch written instead of starting over.
+"""
+
+import logging
+from itertools import islice
+from multiprocessing import Pool
+
+from util import blocks
+from checkpoint import Checkpoint
+
+logger = logging.getLogger(__name__)
+
+# the jar paths and segmenter of a worker process, see init_segmenter
+_segmenter_paths = None
+_segmenter = None
+
+
+def init_segmenter(path_to_slf4j, path_to_jar):
+    """
+    Only records the paths: the segmenter is made on the first batch, where an error
+    (a wrong jar path...) reaches the parent instead of killing the worker as it starts
+    """
+    global _segmenter_paths
+    _segmenter_paths = (path_to_slf4j, path_to_jar)
+
+
+def get_segmenter():
+    global _segmenter
+    if _segmenter is None:
+        from nltk.tokenize.stanford_segmenter import StanfordSegmenter
+
+        path_to_slf4j, path_to_jar = _segmenter_paths
+        _segmenter = StanfordSegmenter(path_to_slf4j=path_to_slf4j, path_to_jar=path_to_jar)
+        _segmenter.default_config('zh')
+    return _segmenter
+
+
+def segment_batch(items):
+    """
+    :param items: list of (number, "s1\\ts2\\tlabel\\n")
+    :return: list of (number, segmented example line), aligned with items
+    """
+    s1_list, s2_list, labels = [], [], []
+    for _, ex in items:
+        s1, s2, label = ex.split('\t')
+        s1_list.append(s1.decode('utf-8'))
+        s2_list.append(s2.decode('utf-8'))
+        labels.append(label)
+
+    # one run of the segmenter for both sides, s1 lines then s2 lines
+    lines = get_segmenter().segment_sents(s1_list + s2_list).split('\n')[:-1]
+    if len(lines) != 2 * len(items):
+        raise Exception("segmenting examples {} to {}: got {} lines for {} sentences".format(
+            items[0][0], items[-1][0], len(lines), 2 * len(items)))
+
+    n = len(items)
+    # label has '\n'
+    return [(items[i][0], "\t".join([lines[i].encode('utf-8'), lines[n + i].encode('utf-8'), labels[i]]))
+            for i in range(n)]
+
+
+def segment_examples(examples, output_path, path_to_slf4j, path_to_jar, batch_size=10000, processes=1,
+                     restart=False):
+    """
+    Segment the s1 and s2 of every example and write the segmented examples to output_path, in order.
+    A run that didn't finish is resumed after its last checkpoint, unless restart is set;
+    examples must then come in the same order as in that run.
+
+    :param examples: iterable of "s1\\ts2\\tlabel\\n" lines
+    :return: the number of examples in output_path
+    """
+    checkpoint = Checkpoint(output_path)
+    state = None if restart else checkpoint.load()
+    if state is None:
+        resume_offset, output_size = 0, 0
+    else:
+        resume_offset, output_size = state["input_offset"], state["output_size"]
+        logger.info("resuming segmentation after {} examples".format(resume_offset))
+
+    pool = Pool(processes, initializer=init_segmenter, initargs=(path_to_slf4j, path_to_jar))
+    try:
+        with open(output_path, 'ab') as w:
+            # drop whatever was written after the checkpoint, it is about to be written again
+            w.truncate(output_size)
+
+            i = resume_offset
+            items = islice(enumerate(examples), resume_offset, None)
+            # imap reads all of its input at once, so it is given a few batches at a time
+            for window in blocks(blocks(items, batch_size), 2 * processes):
+                for segmented in pool.imap(segment_batch, window):
+                    for number, example_line in segmented:
+                        assert number == i
+                        w.write(example_line)
+                        i += 1
+                    checkpoint.save(w, i, i)
+                    logger.info("segmented {} examples".format(i))
+
+            checkpoint.save(w, i, i, done=True)
+    finally:
+        pool.close()
+        pool.join()
+
+    return i
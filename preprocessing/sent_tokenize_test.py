@@ -0,0 +1,130 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Checks gigaword_cn.sent_tokenize against the character by character
+tokenizer it replaced, on the cases of ch_ssplit_tests.json and on random
+paragraphs, and times the two with --benchmark.
+"""
+
+import sys
+import json
+import time
+import random
+import argparse
+
+from gigaword_cn import sent_tokenize
+
+reload(sys)
+sys.setdefaultencoding('utf8')
+
+
+def setup_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--random_cases", default=100000, type=int, help="number of random paragraphs to compare on")
+    parser.add_argument("--benchmark", action='store_true', help="time both tokenizers")
+    parser.add_argument("--benchmark_file", type=str, default="",
+                        help="extracted gigaword file to time on, random paragraphs by default")
+    parser.add_argument("--benchmark_lines", default=20000, type=int)
+    return parser.parse_args()
+
+
+def reference_sent_tokenize(p):
+    # the original tokenizer, one character at a time
+    sents = []
+    sent = []
+
+    prev_stop_tok = False  # manual lookahead for ?", !", 。"
+    inside_quot = False
+    for w in p.decode('utf-8'):
+
+        if w == '"'.decode('utf-8') and inside_quot:
+            inside_quot = False
+        elif w == '"'.decode('utf-8'):
+            inside_quot = True
+
+        if prev_stop_tok and w == '"'.decode('utf-8') and not inside_quot:
+            sent.append(w)
+            sents.append("".join(sent))
+            sent = []
+            prev_stop_tok = False
+            continue
+        if prev_stop_tok and not inside_quot:
+            # meaning it's not `“。` scenario
+            sents.append("".join(sent))
+            sent = [w]
+            prev_stop_tok = False
+            continue
+
+        if w == "。".decode('utf-8') or w == "?".decode('utf-8') or w == "!".decode('utf-8'):
+            sent.append(w)
+            prev_stop_tok = True
+        elif w == ";".decode('utf-8') and not inside_quot:
+            sent.append("。")
+            sents.append("".join(sent))
+            sent = []
+        else:
+            sent.append(w)
+
+    if prev_stop_tok:
+        sents.append("".join(sent))
+
+    return sents
+
+
+def random_paragraph(rng, length):
+    # mostly the characters the tokenizer looks at
+    alphabet = [u'"', u'。', u'?', u'!', u';', u',', u' ', u'a', u'中', u'文', u'“', u'”']
+    return u"".join(rng.choice(alphabet) for _ in range(length)).encode("utf-8")
+
+
+def test(n_random):
+    failures = 0
+
+    test_items = json.load(open("ch_ssplit_tests.json"))["test_items"]
+    print("{} fixed cases are being tested".format(len(test_items)))
+    for item in test_items:
+        output = sent_tokenize(item["paragraph"].encode("utf-8"))
+        if output != item["sentences"] or output != reference_sent_tokenize(item["paragraph"].encode("utf-8")):
+            print("====== TEST FAILED ======" + "\nparagraph: " + item["paragraph"] + "\nactual output: " +
+                  json.dumps(output, ensure_ascii=False) + "\ndesired output: " + json.dumps(item["sentences"], ensure_ascii=False))
+            failures += 1
+
+    print("{} random cases are being tested".format(n_random))
+    rng = random.Random(123)
+    for _ in range(n_random):
+        p = random_paragraph(rng, rng.randint(0, 20))
+        output = sent_tokenize(p)
+        desired = reference_sent_tokenize(p)
+        if output != desired:
+            print("====== TEST FAILED ======" + "\nparagraph: " + p + "\nactual output: " +
+                  json.dumps(output, ensure_ascii=False) + "\ndesired output: " + json.dumps(desired, ensure_ascii=False))
+            failures += 1
+
+    if failures == 0:
+        print("All tests passed.")
+
+
+def benchmark(path, n_lines):
+    if path:
+        with open(path, 'rb') as f:
+            paragraphs = [line.rstrip('\n') for _, line in zip(range(n_lines), f)]
+    else:
+        rng = random.Random(123)
+        sentence = "据报导,上个月细螺旋体病已感染了四千八百八十九人,并且造成一百六十五人丧生。"
+        paragraphs = []
+        for _ in range(n_lines):
+            paragraphs.append("".join(rng.choice([sentence, "他说:\"" + sentence + "\"", sentence[:-3] + ";"])
+                                      for _ in range(rng.randint(1, 8))))
+
+    for name, tokenize in [("reference", reference_sent_tokenize), ("sent_tokenize", sent_tokenize)]:
+        start = time.time()
+        n_sents = sum(len(tokenize(p)) for p in paragraphs)
+        print("{}: {} paragraphs, {} sentences in {:.2f}s".format(name, len(paragraphs), n_sents, time.time() - start))
+
+
+if __name__ == '__main__':
+    args = setup_args()
+    test(args.random_cases)
+    if args.benchmark:
+        benchmark(args.benchmark_file, args.benchmark_lines)
@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+
+"""
+Runs the filter stage over several processes
+
+Every input file is cut into byte ranges that start at the beginning of a line,
+and each range is filtered by a worker process into its own output file.
+The shard outputs are then merged in input order into the final JSON-lines file,
+so the result is the same as filtering the files one line after the other.
+
+A worker doesn't know the sentence before its range: it writes None as the
+"previous" of its first sentence, and the merge fills in the last sentence
+of the range before.
+"""
+
+import os
+import logging
+from multiprocessing import Pool
+
+from util import FilteredSentenceWriter, read_filtered_sentences
+
+logger = logging.getLogger(__name__)
+
+
+def line_shards(path, n_shards):
+    """
+    :return: list of byte ranges (start, end) covering the file, each starting at the beginning of a line
+    """
+    size = os.path.getsize(path)
+    starts = [0]
+    with open(path, 'rb') as f:
+        for k in range(1, n_shards):
+            position = size * k // n_shards
+            if position <= starts[-1]:
+                continue
+            # move to the first line starting at or after position
+            f.seek(position - 1)
+            f.readline()
+            if f.tell() >= size:
+                break
+            if f.tell() > starts[-1]:
+                starts.append(f.tell())
+    return zip(starts, starts[1:] + [size])
+
+
+def universal_lines(line):
+    """
+    Split a decoded line the way io.open(..., 'rU') does: "\\r\\n" and "\\r" both end a line
+    """
+    if u"\r" not in line:
+        yield line
+        return
+    parts = line.replace(u"\r\n", u"\n").split(u"\r")
+    for part in parts[:-1]:
+        yield part + u"\n"
+    if len(parts[-1]) > 0:
+        yield parts[-1]
+
+
+def read_raw_lines(path, start=0, end=None):
+    """
+    :yields: the lines of the file starting in [start, end), as they are in the file
+    """
+    with open(path, 'rb') as f:
+        f.seek(start)
+        position = start
+        for line in f:
+            if end is not None and position >= end:
+                break
+            position += len(line)
+            yield line
+
+
+def read_lines(path, start=0, end=None):
+    """
+    :yields: the lines of the file starting in [start, end), decoded from utf-8
+    """
+    for line in read_raw_lines(path, start, end):
+        for decoded in universal_lines(line.decode("utf-8")):
+            yield decoded
+
+
+def _filter_shard(job):
+    reader, path, start, end, shard_path = job
+    with FilteredSentenceWriter(shard_path, reader.markers) as writer:
+        # a file starts with an empty previous sentence, otherwise the merge fills it in
+        return reader.filter_lines(read_lines(path, start, end), u"" if start == 0 else None, writer)
+
+
+def filter_files(paths, output_path, reader, processes=1, mode='wb'):
+    """
+    :param reader: pipeline.CorpusReader, its filter_lines(lines, previous_sentence, writer) filters
+        lines into writer and returns the last sentence it saw, previous_sentence if it saw none
+    :return: the FilteredSentenceWriter, closed, for its statistics
+    """
+    writer = FilteredSentenceWriter(output_path, reader.markers, mode)
+
+    if processes <= 1:
+        for path in paths:
+            logger.info("reading {}".format(path))
+            reader.filter_lines(read_lines(path), u"", writer)
+            logger.info("{} file finished".format(path))
+        writer.close()
+        return writer
+
+    jobs = []
+    for path in paths:
+        for start, end in line_shards(path, processes):
+            shard_path = "{}.shard{}".format(output_path, len(jobs))
+            jobs.append((reader, path, start, end, shard_path))
+    logger.info("filtering {} files as {} shards on {} processes".format(len(paths), len(jobs), processes))
+
+    pool = Pool(processes)
+    try:
+        last_sentences = pool.map(_filter_shard, jobs, chunksize=1)
+    finally:
+        pool.close()
+        pool.join()
+
+    logger.info("merging shards")
+    previous_sentence = u""
+    for job, last_sentence in zip(jobs, last_sentences):
+        shard_path = job[-1]
+        for sentence, previous, sentence_markers in read_filtered_sentences(shard_path):
+            if previous is None:
+                previous = previous_sentence
+            writer.write(sentence, previous, sentence_markers)
+        if last_sentence is not None:
+            previous_sentence = last_sentence
+        os.remove(shard_path)
+    writer.close()
+    return writer
@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+
+"""
+Building blocks of the sentence cleanups, compiled once at import
+
+Cleanups run on every sentence of every corpus, so each step either skips
+the sentence outright when it can't apply, or does its work in a single
+C-level call (str.translate for per-character deletions and replacements).
+Every step does exactly what the chain of str.replace / re.sub calls
+it replaces did, see cleanup_test.py.
+"""
+
+import re
+
+# in this order: "&amp;" is replaced before "&apos;" and "&quot;",
+# so "&amp;quot;" ends up as '"' just like it always did
+HTML_ENTITIES = [
+    ("&amp;gt;", ""),
+    ("&lt;", '<'),
+    ("&gt;", '>'),
+    ("&amp;", '&'),
+    ("&apos;", '\''),
+    ("&quot;", '"'),
+]
+
+
+def unescape_entities(sent):
+    if "&" not in sent:
+        return sent
+    for entity, replacement in HTML_ENTITIES:
+        sent = sent.replace(entity, replacement)
+    return sent
+
+
+class CharTable(object):
+    """
+    Deletes and replaces single characters, for str (utf-8) and unicode alike.
+    A replacement must not contain a character that is deleted or replaced.
+
+    :param deletions: ascii characters to delete
+    :param replacements: dict of character (utf-8 str) -> replacement (utf-8 str)
+    """
+    def __init__(self, deletions="", replacements=None):
+        self.deletions = deletions
+        # str.translate only maps single bytes, other characters are replaced afterwards
+        self.replacements = sorted((replacements or {}).items())
+
+        self.unicode_table = dict((ord(c), None) for c in deletions)
+        for c, r in self.replacements:
+            self.unicode_table[ord(c.decode("utf-8"))] = r.decode("utf-8")
+
+    def __call__(self, s):
+        if isinstance(s, unicode):
+            return s.translate(self.unicode_table)
+        if self.deletions:
+            s = s.translate(None, self.deletions)
+        for c, r in self.replacements:
+            if c in s:
+                s = s.replace(c, r)
+        return s
+
+
+class PatternSub(object):
+    """
+    A precompiled re.sub, skipped when the sentence can't contain a match
+
+    :param required: a substring every match contains
+    """
+    def __init__(self, pattern, replacement, required):
+        self.pattern = re.compile(pattern)
+        self.replacement = replacement
+        self.required = required
+
+    def __call__(self, s):
+        if self.required not in s:
+            return s
+        return self.pattern.sub(self.replacement, s)
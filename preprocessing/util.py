@@ -1,2 +1,238 @@
+import json
+import random
+import struct
+import hashlib
+from collections import OrderedDict
+
+def to_unicode(s):
+    """
+    :param s: unicode, or str in utf-8
+    """
+    if isinstance(s, unicode):
+        return s
+    return s.decode("utf-8")
+
 def rephrase(str):
-    return str.replace("for example", "for_example")
\ No newline at end of file
+    return str.replace("for example", "for_example")
+
+def blocks(iterable, size):
+    """
+    yields lists of up to `size` consecutive items
+    """
+    block = []
+    for item in iterable:
+        block.append(item)
+        if len(block) == size:
+            yield block
+            block = []
+    if len(block) > 0:
+        yield block
+
+class FilteredSentenceWriter(object):
+    """
+    Writes the output of the filter stage as it goes, as JSON lines:
+    {"sentence": ..., "previous": ..., "markers": [...]}, one line per sentence
+    with every marker it was filtered for.
+    """
+    def __init__(self, path, markers, mode='wb'):
+        self.path = path
+        self.markers = list(markers)
+        self.file = open(path, mode)
+        self.counts = OrderedDict((marker, 0) for marker in markers)
+
+    def write(self, sentence, previous, markers):
+        record = {"sentence": sentence, "previous": previous, "markers": markers}
+        self.file.write(json.dumps(record) + "\n")
+        for marker in markers:
+            self.counts[marker] = self.counts.get(marker, 0) + 1
+
+    def statistics_report(self):
+        return "\n".join("{}\t{}".format(marker, n) for marker, n in self.counts.iteritems())
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+def read_filtered_sentences(path, markers=None, offsets=False):
+    """
+    Reads back what FilteredSentenceWriter wrote, one line at a time
+
+    :param markers: only keep these markers, and the sentences that have one of them
+    :param offsets: also yield the offset in the file right after each sentence
+    :yields: (sentence, previous, markers), or (sentence, previous, markers, offset)
+    """
+    offset = 0
+    with open(path, 'rb') as f:
+        for line in f:
+            offset += len(line)
+            record = json.loads(line)
+            kept = record["markers"]
+            if markers is not None:
+                kept = [marker for marker in kept if marker in markers]
+                if len(kept) == 0:
+                    continue
+            if offsets:
+                yield record["sentence"], record["previous"], kept, offset
+            else:
+                yield record["sentence"], record["previous"], kept
+
+def fingerprint(*parts):
+    """
+    64-bit fingerprint of a tuple of strings, the same from one run to the next
+
+    :param parts: str or unicode, unicode is hashed as utf-8
+    """
+    encoded = [part.encode("utf-8") if isinstance(part, unicode) else part for part in parts]
+    return struct.unpack("<q", hashlib.md5("\0".join(encoded)).digest()[:8])[0]
+
+class SeenSet(object):
+    """
+    Remembers what it has seen by fingerprint rather than by value, so that
+    deduplicating a corpus costs a small int per entry instead of a copy of its text.
+    Two different entries share a fingerprint with odds of about n^2 / 2^65.
+    """
+    def __init__(self):
+        self.fingerprints = set()
+
+    def first_time(self, *parts):
+        """
+        :return: True the first time these parts are seen, False after that
+        """
+        key = fingerprint(*parts)
+        if key in self.fingerprints:
+            return False
+        self.fingerprints.add(key)
+        return True
+
+    def __len__(self):
+        return len(self.fingerprints)
+
+def hash_split(split_proportions, *parts):
+    """
+    The split an example belongs to, decided by the fingerprint of its text alone:
+    an example lands in the same split whatever else is in the corpus, so appending
+    to a corpus never moves test examples into train, and shards can be split separately.
+
+    :param split_proportions: dict of "train", "valid", "test" -> proportion
+    :param parts: the text of the example, like (s1, s2)
+    :return: "train", "valid" or "test"
+    """
+    # 53 bits of the fingerprint, as a float uniform in [0, 1)
+    u = (fingerprint(*parts) & ((1 << 53) - 1)) / float(1 << 53)
+    if u < split_proportions["train"]:
+        return "train"
+    if u < split_proportions["train"] + split_proportions["valid"]:
+        return "valid"
+    return "test"
+
+def hash_split_indices(keys, split_proportions):
+    """
+    :param keys: the (s1, s2) of each example
+    :return: dict of "train", "valid", "test" -> indices of the examples in that split, in order
+    """
+    splits = {"train": [], "valid": [], "test": []}
+    for i, key in enumerate(keys):
+        splits[hash_split(split_proportions, *key)].append(i)
+    return splits
+
+def drop_repeats(items):
+    """
+    :param items: iterable of (sentence, previous, ...)
+    :yields: the items in their order, without the ones whose (sentence, previous) was already seen
+    """
+    seen = SeenSet()
+    for item in items:
+        if seen.first_time(item[0], item[1]):
+            yield item
+
+class Reservoir(object):
+    """
+    A uniform random sample of up to `size` items of a stream, without holding the stream:
+    reservoir sampling, every item seen so far is in the sample with the same odds.
+    """
+    def __init__(self, size, rng=random):
+        """
+        :param rng: random.Random, or the random module itself
+        """
+        self.size = size
+        self.rng = rng
+        self.items = []
+        self.seen = 0
+
+    def add(self, item):
+        self.seen += 1
+        if len(self.items) < self.size:
+            self.items.append(item)
+        else:
+            i = self.rng.randrange(self.seen)
+            if i < self.size:
+                self.items[i] = item
+
+    def sample(self):
+        """
+        :return: the sampled items, in random order
+        """
+        self.rng.shuffle(self.items)
+        return self.items
+
+class MarkerScanner(object):
+    """
+    Finds every marker of a marker set in a sentence with one pass over its words,
+    instead of one `marker in words` list scan per marker.
+
+    Multi-word markers ("for example", "ya que") are either looked up as the single
+    word rephrase() turns them into ("for_example"), or with substring_phrases,
+    searched for in the sentence string.
+
+    Words can be unicode (the filter stage decodes its input) or utf-8 str: markers
+    are looked up in both forms, since a set doesn't match a non-ascii unicode word with its utf-8 str.
+    """
+    def __init__(self, markers, lowercase=False, substring_phrases=False):
+        """
+        :param lowercase: lowercase the words before looking them up
+        :param substring_phrases: look for multi-word markers with `marker in sentence`
+        """
+        self.markers = list(markers)
+        self.lowercase = lowercase
+
+        # word -> markers that word is a hit for, the markers as given
+        self.word_markers = {}
+        # (marker, unicode marker)
+        self.phrases = []
+        for marker in self.markers:
+            words = marker.split()
+            if len(words) > 1 and substring_phrases:
+                self.phrases.append((marker, to_unicode(marker)))
+            else:
+                word = "_".join(words)
+                # for ascii markers both forms are the same key
+                for key in set([to_unicode(word), to_unicode(word).encode("utf-8")]):
+                    self.word_markers.setdefault(key, []).append(marker)
+        self.vocabulary = set(self.word_markers)
+        self.order = {marker: i for i, marker in enumerate(self.markers)}
+
+    def scan(self, words, sentence=None):
+        """
+        :param words: list of the words of the sentence
+        :param sentence: the sentence string, only needed with substring_phrases
+        :return: list of markers found, in marker set order
+        """
+        if self.lowercase:
+            words = [w.lower() for w in words]
+
+        found = []
+        for word in self.vocabulary.intersection(words):
+            found += self.word_markers[word]
+
+        for marker, unicode_marker in self.phrases:
+            if (unicode_marker if isinstance(sentence, unicode) else marker) in sentence:
+                found.append(marker)
+
+        if len(found) > 1:
+            found.sort(key=self.order.__getitem__)
+        return found